@@ -0,0 +1,40 @@
+"""Заміри place_filters проти початкової реалізації з tests/test_place_filters.py.
+
+    python bench_place_filters.py
+"""
+import timeit
+
+from place_filters import filter_batch, is_allowed
+from tests.test_place_filters import legacy_is_place_allowed, sample_items
+
+ITEMS = 20000
+ROUNDS = 5
+
+
+def main():
+    items, decisions = sample_items(ITEMS)
+    for section in ("gastro", "hotels", "history", None):
+        def legacy(s=section):
+            return [
+                it for it in items
+                if legacy_is_place_allowed(it, s, decisions[it["place_id"]])
+            ]
+
+        def single(s=section):
+            return [it for it in items if is_allowed(it, s, decisions[it["place_id"]])]
+
+        def batch(s=section):
+            return filter_batch(items, s, decisions.get)
+
+        t_legacy, t_single, t_batch = (
+            timeit.timeit(f, number=ROUNDS) / ROUNDS for f in (legacy, single, batch)
+        )
+        print(
+            f"{str(section):>8}: legacy {t_legacy * 1e3:.1f} ms, "
+            f"compiled {t_single * 1e3:.1f} ms, "
+            f"batch {t_batch * 1e3:.1f} ms per {len(items)} items"
+        )
+
+
+if __name__ == "__main__":
+    main()
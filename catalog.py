@@ -0,0 +1,197 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from geo import distance_m
+
+CATALOG_FILE = os.getenv("PLACES_CATALOG_FILE", "places_catalog.db")
+
+# Розмір клітинки сітки (~500 м на широті Одеси)
+CELL_LAT = 0.0045
+CELL_LON = 0.0065
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS places (
+    place_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    rating REAL,
+    reviews INTEGER NOT NULL DEFAULT 0,
+    address TEXT NOT NULL DEFAULT '',
+    photo_reference TEXT,
+    types TEXT NOT NULL DEFAULT '[]',
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS place_cells (
+    type TEXT NOT NULL,
+    cell_y INTEGER NOT NULL,
+    cell_x INTEGER NOT NULL,
+    place_id TEXT NOT NULL,
+    PRIMARY KEY (type, cell_y, cell_x, place_id)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    type TEXT NOT NULL,
+    cell_y INTEGER NOT NULL,
+    cell_x INTEGER NOT NULL,
+    harvested_at REAL NOT NULL,
+    PRIMARY KEY (type, cell_y, cell_x)
+);
+"""
+
+_local = threading.local()
+
+
+# Окреме з'єднання на потік: виклики з бота йдуть через asyncio.to_thread
+def _db() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CATALOG_FILE, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def close() -> None:
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+    _local.conn = None
+
+
+def cell_of(lat: float, lon: float) -> Tuple[int, int]:
+    return math.floor(lat / CELL_LAT), math.floor(lon / CELL_LON)
+
+
+def cell_center(cell_y: int, cell_x: int) -> Tuple[float, float]:
+    return (cell_y + 0.5) * CELL_LAT, (cell_x + 0.5) * CELL_LON
+
+
+def cells_in_bounds(
+    south: float, west: float, north: float, east: float
+) -> List[Tuple[int, int]]:
+    y0, x0 = cell_of(south, west)
+    y1, x1 = cell_of(north, east)
+    return [(y, x) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+
+def _cell_range(lat: float, lon: float, radius: int) -> Tuple[int, int, int, int]:
+    dlat = radius / 111320
+    dlon = radius / (111320 * math.cos(math.radians(lat)))
+    y0, x0 = cell_of(lat - dlat, lon - dlon)
+    y1, x1 = cell_of(lat + dlat, lon + dlon)
+    return y0, y1, x0, x1
+
+
+def _item_from_row(row: Tuple) -> Dict:
+    place_id, name, lat, lon, rating, reviews, address, photo_reference, types = row
+    item = {
+        "place_id": place_id,
+        "name": name,
+        "geometry": {"location": {"lat": lat, "lng": lon}},
+        "user_ratings_total": reviews,
+        "vicinity": address,
+        "types": json.loads(types),
+    }
+    if rating is not None:
+        item["rating"] = rating
+    if photo_reference:
+        item["photos"] = [{"photo_reference": photo_reference}]
+    return item
+
+
+def is_covered(lat: float, lon: float, radius: int, place_type: str) -> bool:
+    y0, y1, x0, x1 = _cell_range(lat, lon, radius)
+    (count,) = _db().execute(
+        "SELECT COUNT(*) FROM coverage "
+        "WHERE type = ? AND cell_y BETWEEN ? AND ? AND cell_x BETWEEN ? AND ?",
+        (place_type, y0, y1, x0, x1),
+    ).fetchone()
+    return count == (y1 - y0 + 1) * (x1 - x0 + 1)
+
+
+# Кандидати у форматі nearbysearch або None, якщо район ще не зібрано
+def nearby(
+    lat: float, lon: float, radius: int, place_type: str
+) -> Optional[List[Dict]]:
+    if not is_covered(lat, lon, radius, place_type):
+        return None
+    y0, y1, x0, x1 = _cell_range(lat, lon, radius)
+    rows = _db().execute(
+        "SELECT p.place_id, p.name, p.lat, p.lon, p.rating, p.reviews, p.address, "
+        "p.photo_reference, p.types "
+        "FROM place_cells c JOIN places p ON p.place_id = c.place_id "
+        "WHERE c.type = ? AND c.cell_y BETWEEN ? AND ? AND c.cell_x BETWEEN ? AND ?",
+        (place_type, y0, y1, x0, x1),
+    ).fetchall()
+    return [
+        _item_from_row(row) for row in rows
+        if distance_m(lat, lon, row[2], row[3]) <= radius
+    ]
+
+
+def store(items: Iterable[Dict], place_type: str) -> None:
+    now = time.time()
+    place_rows = []
+    cell_rows = []
+    for item in items:
+        pid = item.get("place_id")
+        if not pid:
+            continue
+        lat = item["geometry"]["location"]["lat"]
+        lon = item["geometry"]["location"]["lng"]
+        photo_reference = None
+        if item.get("photos"):
+            photo_reference = item["photos"][0].get("photo_reference")
+        place_rows.append((
+            pid,
+            item.get("name", "Без назви"),
+            lat,
+            lon,
+            item.get("rating"),
+            item.get("user_ratings_total", 0),
+            item.get("vicinity", "") or item.get("formatted_address", ""),
+            photo_reference,
+            json.dumps(item.get("types", []), ensure_ascii=False),
+            now,
+        ))
+        cell_rows.append((place_type, *cell_of(lat, lon), pid))
+
+    db = _db()
+    with db:
+        db.executemany(
+            "INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            place_rows,
+        )
+        db.executemany(
+            "INSERT OR IGNORE INTO place_cells VALUES (?, ?, ?, ?)", cell_rows
+        )
+
+
+def mark_covered(cell_y: int, cell_x: int, place_type: str) -> None:
+    db = _db()
+    with db:
+        db.execute(
+            "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?)",
+            (place_type, cell_y, cell_x, time.time()),
+        )
+
+
+def stale_cells(max_age: int, limit: int = 100) -> List[Tuple[str, int, int]]:
+    return _db().execute(
+        "SELECT type, cell_y, cell_x FROM coverage "
+        "WHERE harvested_at < ? ORDER BY harvested_at LIMIT ?",
+        (time.time() - max_age, limit),
+    ).fetchall()
+
+
+def stats() -> Dict:
+    db = _db()
+    (places,) = db.execute("SELECT COUNT(*) FROM places").fetchone()
+    (cells,) = db.execute("SELECT COUNT(*) FROM coverage").fetchone()
+    return {"places": places, "covered_cells": cells}
@@ -0,0 +1,9 @@
+from math import asin, cos, radians, sin
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    r = 6371000
+    phi1, phi2 = radians(lat1), radians(lat2)
+    dphi, dlambda = radians(lat2 - lat1), radians(lon2 - lon1)
+    a = sin(dphi / 2) ** 2 + cos(phi1) * cos(phi2) * sin(dlambda / 2) ** 2
+    return r * 2 * asin((a ** 0.5))
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+import storage
+
+FLUSH_INTERVAL = 5
+# memory — лічильники в процесі з періодичним скиданням;
+# sqlite — кожне списання атомарно в базі, потрібно, коли кілька процесів бота
+# ділять одну bot.db (типово для webhook-режиму)
+LIMITS_BACKEND = os.getenv(
+    "LIMITS_BACKEND", "sqlite" if os.getenv("BOT_MODE") == "webhook" else "memory"
+)
+
+LimitKey = Tuple[int, str]
+
+
+class DailyLimits:
+    def __init__(self, tz, shared: bool = LIMITS_BACKEND == "sqlite"):
+        self.tz = tz
+        self.shared = shared
+        self._day: Optional[str] = None
+        self._counts: Dict[LimitKey, int] = {}
+        self._dirty: Set[LimitKey] = set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _today(self) -> str:
+        return datetime.now(self.tz).strftime("%Y-%m-%d")
+
+    async def _ensure_day(self) -> None:
+        if self._day == self._today():
+            return
+        async with self._lock:
+            day = self._today()
+            if self._day == day:
+                return
+            # Північ за Києвом: дописуємо старий день, чистимо минулі дні
+            # й піднімаємо сьогоднішні лічильники
+            await self._flush()
+            await asyncio.to_thread(storage.prune_limits, day)
+            self._counts = await asyncio.to_thread(storage.load_limits, day)
+            self._day = day
+
+    # Перевірка й списання в одному кроці без await між ними,
+    # тому паралельні натискання не проскочать ліміт
+    async def acquire(self, user_id: int, key: str, limit: int) -> bool:
+        if self.shared:
+            day = self._today()
+            if self._day != day:
+                self._day = day
+                await asyncio.to_thread(storage.prune_limits, day)
+            return await asyncio.to_thread(
+                storage.acquire_limit, day, user_id, key, limit
+            )
+        await self._ensure_day()
+        counter = (user_id, key)
+        used = self._counts.get(counter, 0)
+        if used >= limit:
+            return False
+        self._counts[counter] = used + 1
+        self._dirty.add(counter)
+        return True
+
+    async def release(self, user_id: int, key: str) -> None:
+        if self.shared:
+            await asyncio.to_thread(storage.release_limit, self._today(), user_id, key)
+            return
+        counter = (user_id, key)
+        used = self._counts.get(counter, 0)
+        if used > 0:
+            self._counts[counter] = used - 1
+            self._dirty.add(counter)
+
+    async def _flush(self) -> None:
+        if not self._dirty or self._day is None:
+            return
+        dirty, self._dirty = self._dirty, set()
+        rows = [
+            (user_id, key, self._counts.get((user_id, key), 0))
+            for user_id, key in dirty
+        ]
+        try:
+            await asyncio.to_thread(storage.save_limits, self._day, rows)
+        except Exception:
+            self._dirty |= dirty
+            raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self._flush()
+            except Exception as e:
+                print("Limits flush error:", e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._flush()
@@ -5,7 +5,11 @@ locations = [
     {'name': 'Дерибасівська вулиця', 'lat': 46.485122, 'lon': 30.742351},
     {'name': 'Пасаж', 'lat': 46.484058, 'lon': 30.735311},
     {'name': 'Міський сад', 'lat': 46.484720, 'lon': 30.741520},
-    {'name': 'Музей західного і східного мистецтва', 'lat': 46.484280, 'lon': 30.739142},
+    {
+        'name': 'Музей західного і східного мистецтва',
+        'lat': 46.484280,
+        'lon': 30.739142,
+    },
     {'name': 'Будинок з однією стіною', 'lat': 46.490017, 'lon': 30.745130},
     {'name': 'Музей контрабанди', 'lat': 46.484050, 'lon': 30.745410},
     {'name': 'Грецький парк', 'lat': 46.484844, 'lon': 30.751689},
@@ -1,32 +1,56 @@
-import json
-import os
 import asyncio
-from math import radians, sin, cos, asin, sqrt
+import os
 from datetime import datetime
+from typing import KeysView
+from urllib.parse import quote
 
 import pytz
-import gspread
-from google.oauth2.service_account import Credentials
-
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, F, types
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
 from aiogram.types import (
-    Message, InlineKeyboardMarkup, InlineKeyboardButton,
-    KeyboardButton, ReplyKeyboardMarkup
+    BufferedInputFile,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InputMediaPhoto,
+    KeyboardButton,
+    Message,
+    ReplyKeyboardMarkup,
 )
-from aiogram.enums import ParseMode
-from aiogram.client.default import DefaultBotProperties
 from dotenv import load_dotenv
 
+import sheets_db
+import storage
+import webhook
+from geo import distance_m
+from limits import DailyLimits
+from map_image import ensure_basemap, route_map
+from outbound import OutboundScheduler
+from photo_cache import PhotoCache
 from places import (
-    get_random_places,
-    get_random_place_near,
+    CATALOG_ENABLED,
     CENTER_LAT,
     CENTER_LON,
-    HOTEL_TYPES,
     GASTRO_TYPES,
-    HISTORICAL_TYPES,
-    SHOP_TYPES,
+    HOTEL_TYPES,
+    build_firm_route,
+    catalog_refresh_loop,
+    close_http_session,
+    get_cache_stats,
+    get_random_places,
+    save_nearby_cache,
+    type_yield,
+    update_place_decision,
 )
+from route_order import order_route, route_length
+from route_pool import RoutePool
+from sessions import build_session_storage, pop_session
+from sheets_db import append_row as gs_append_row
+from type_yield import BAND_M
+from users import UserRegistry
+from visited import VisitedStore
 
 # --- Налаштування ---
 load_dotenv()
@@ -40,47 +64,45 @@ LIMITS_FILE = "limits.json"
 FEEDBACK_FILE = "place_feedback.json"
 SAVED_FILE = "saved_places.json"
 
-SPREADSHEET_NAME = os.getenv("GOOGLE_SHEETS_SPREADSHEET")
-CREDS_JSON = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
-
 INSTAGRAM_URL = os.getenv("INSTAGRAM_URL", "https://www.instagram.com/odesa_navmannya")
 BOT_LINK = os.getenv("BOT_LINK", "https://t.me/odesanavmannya_bot")
 
+# polling | webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Оглядова мапа після карток маршруту: 1 — завжди, 0 — ніколи,
+# auto — лише коли є підкладка odesa_basemap.png
+# (без неї кожна мапа — платний запит Static Maps)
+ROUTE_MAP = os.getenv("ROUTE_MAP", "auto")
+route_map_enabled = ROUTE_MAP == "1"
+
+# Як надсилати картки маршруту: album | concurrent | sequential
+ROUTE_DELIVERY = os.getenv("ROUTE_DELIVERY", "album")
+
 DAILY_WALKS_LIMIT = 3
 DAILY_RECS_LIMIT = 5
 
 ODESSA_TZ = pytz.timezone("Europe/Kyiv")
 
-for file in [VISITED_FILE, LIMITS_FILE, USERS_FILE, FEEDBACK_FILE, SAVED_FILE]:
-    if not os.path.exists(file):
-        with open(file, "w", encoding="utf-8") as f:
-            default_value = [] if file == USERS_FILE else {}
-            json.dump(default_value, f, ensure_ascii=False, indent=2)
+daily_limits = DailyLimits(ODESSA_TZ)
+visited_store = VisitedStore()
+user_registry = UserRegistry()
+route_pool = RoutePool()
+photo_cache = PhotoCache()
+catalog_task: asyncio.Task | None = None
 
 bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
+outbound = OutboundScheduler()
+bot.session.middleware(outbound)
+dp = Dispatcher(storage=build_session_storage())
 
-# --- Google Sheets ---
-gs_client = None
-if CREDS_JSON and SPREADSHEET_NAME:
-    try:
-        creds_dict = json.loads(CREDS_JSON)
-        creds = Credentials.from_service_account_info(
-            creds_dict,
-            scopes=[
-                "https://www.googleapis.com/auth/spreadsheets",
-                "https://www.googleapis.com/auth/drive"
-            ]
-        )
-        gs_client = gspread.authorize(creds)
-        print("Google Sheets connected")
-    except Exception as e:
-        print("Google Sheets ERROR:", e)
-else:
-    print("Google Sheets disabled: missing GOOGLE_SERVICE_ACCOUNT_JSON or GOOGLE_SHEETS_SPREADSHEET")
 
-user_route_state: dict[int, dict] = {}
-user_feedback_state: dict[int, dict] = {}
+FIRM_SECTIONS = ["history", "shop", "gastro"]
+FIRM_ERRORS = [
+    "Не знайшов історичну точку 😞",
+    "Не знайшов магазин поруч 😞",
+    "Не знайшов гастро-точку поруч 😞",
+]
 
 SECTION_LABELS = {
     "gastro": "гастро",
@@ -127,16 +149,6 @@ FEEDBACK_OPTIONS = {
 }
 
 
-def gs_append_row(worksheet_name: str, row: list):
-    if not gs_client or not SPREADSHEET_NAME:
-        return
-    try:
-        sheet = gs_client.open(SPREADSHEET_NAME).worksheet(worksheet_name)
-        sheet.append_row(row)
-    except Exception as e:
-        print(f"GS append error [{worksheet_name}]:", e)
-
-
 def save_user_to_sheets(user):
     gs_append_row("users", [
         user.id,
@@ -146,7 +158,9 @@ def save_user_to_sheets(user):
     ])
 
 
-def save_place_feedback_to_sheets(user_id: int, section: str, place_id: str, place_name: str, feedback: str):
+def save_place_feedback_to_sheets(
+    user_id: int, section: str, place_id: str, place_name: str, feedback: str
+):
     gs_append_row("place_feedback", [
         datetime.now(ODESSA_TZ).strftime("%Y-%m-%d %H:%M:%S"),
         user_id,
@@ -186,157 +200,62 @@ def save_shown_place_to_sheets(user_id: int, place: dict):
     ])
 
 
-def save_user(user_id: int) -> None:
-    try:
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            users = json.load(f)
-    except Exception:
-        users = []
-    if user_id not in users:
-        users.append(user_id)
-        with open(USERS_FILE, "w", encoding="utf-8") as f:
-            json.dump(users, f, ensure_ascii=False, indent=2)
-
-
-def load_visited(user_id: int) -> set[str]:
-    try:
-        with open(VISITED_FILE, "r", encoding="utf-8") as f:
-            return set(json.load(f).get(str(user_id), []))
-    except Exception:
-        return set()
-
-
-def add_visited(user_id: int, place_ids: list[str]) -> None:
-    try:
-        with open(VISITED_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except Exception:
-        data = {}
-    cur = set(data.get(str(user_id), []))
-    for pid in place_ids:
-        if pid:
-            cur.add(pid)
-    data[str(user_id)] = list(cur)[-500:]
-    with open(VISITED_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-
-def _today_str() -> str:
-    return datetime.now(ODESSA_TZ).strftime("%Y-%m-%d")
+async def save_user(user_id: int) -> bool:
+    return await user_registry.add(user_id)
 
 
-def load_limits() -> dict:
-    try:
-        with open(LIMITS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+async def load_visited(user_id: int) -> KeysView[str]:
+    return await visited_store.get(user_id)
 
 
-def save_limits(data: dict) -> None:
-    with open(LIMITS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+async def add_visited(user_id: int, place_ids: list[str]) -> None:
+    await visited_store.add(user_id, place_ids)
 
 
-def can_use_limit(user_id: int, key: str, limit: int) -> bool:
+async def acquire_limit(user_id: int, key: str, limit: int) -> bool:
     if user_id == MY_ID:
         return True
-    data = load_limits()
-    return data.get(_today_str(), {}).get(str(user_id), {}).get(key, 0) < limit
+    return await daily_limits.acquire(user_id, key, limit)
 
 
-def inc_limit(user_id: int, key: str) -> None:
+async def release_limit(user_id: int, key: str) -> None:
     if user_id == MY_ID:
         return
-    data = load_limits()
-    user_data = data.setdefault(_today_str(), {}).setdefault(str(user_id), {})
-    user_data[key] = user_data.get(key, 0) + 1
-    save_limits(data)
-
-
-def distance_m(lat1, lon1, lat2, lon2):
-    r = 6371000
-    phi1, phi2 = radians(lat1), radians(lat2)
-    dphi, dlambda = radians(lat2 - lat1), radians(lon2 - lon1)
-    a = sin(dphi / 2) ** 2 + cos(phi1) * cos(phi2) * sin(dlambda / 2) ** 2
-    return r * 2 * asin((a ** 0.5))
-
-
-def load_place_feedback() -> dict:
-    try:
-        with open(FEEDBACK_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
+    await daily_limits.release(user_id, key)
 
-def save_place_feedback(data: dict) -> None:
-    with open(FEEDBACK_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
 
-
-def add_place_feedback(place_id: str, section: str, value: str, user_id: int, place_name: str = "") -> None:
+async def add_place_feedback(
+    place_id: str, section: str, value: str, user_id: int, place_name: str = ""
+) -> None:
     if not place_id:
         return
-    data = load_place_feedback()
-    rec = data.setdefault(place_id, {
-        "place_name": place_name,
-        "section": section,
-        "votes": {},
-        "user_votes": {},
-        "updated_at": datetime.now(ODESSA_TZ).isoformat(),
-    })
-
-    rec["place_name"] = place_name or rec.get("place_name", "")
-    rec["section"] = section
-    rec.setdefault("votes", {})
-    rec.setdefault("user_votes", {})
-
-    user_key = str(user_id)
-    prev_vote = rec["user_votes"].get(user_key)
-    if prev_vote:
-        prev_count = rec["votes"].get(prev_vote, 0)
-        if prev_count > 0:
-            rec["votes"][prev_vote] = prev_count - 1
-            if rec["votes"][prev_vote] <= 0:
-                rec["votes"].pop(prev_vote, None)
-
-    rec["user_votes"][user_key] = value
-    rec["votes"][value] = rec["votes"].get(value, 0) + 1
-    rec["updated_at"] = datetime.now(ODESSA_TZ).isoformat()
-    save_place_feedback(data)
-    save_place_feedback_to_sheets(user_id, section, place_id, rec.get("place_name", ""), value)
-
-
-def load_saved(user_id: int):
-    try:
-        with open(SAVED_FILE, "r", encoding="utf-8") as f:
-            return json.load(f).get(str(user_id), [])
-    except Exception:
-        return []
-
+    rec = await asyncio.to_thread(
+        storage.add_place_feedback,
+        place_id,
+        section,
+        value,
+        user_id,
+        place_name,
+        datetime.now(ODESSA_TZ).isoformat(),
+    )
+    update_place_decision(place_id, rec["votes"], rec["version"])
+    save_place_feedback_to_sheets(user_id, section, place_id, rec["place_name"], value)
 
-def save_place_for_user(user_id: int, place_id: str):
-    try:
-        with open(SAVED_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except Exception:
-        data = {}
 
-    user_data = data.setdefault(str(user_id), [])
-    if place_id not in user_data:
-        user_data.append(place_id)
+async def load_saved(user_id: int) -> list[str]:
+    return await asyncio.to_thread(storage.load_saved, user_id)
 
-    with open(SAVED_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
 
+async def save_place_for_user(user_id: int, place_id: str):
+    await asyncio.to_thread(storage.save_place, user_id, place_id)
     save_saved_place_to_sheets(user_id, place_id)
 
 
 def build_feedback_prompt_keyboard(place_id: str, section: str) -> InlineKeyboardMarkup:
     buttons = []
     for text, value in FEEDBACK_OPTIONS.get(section, FEEDBACK_OPTIONS["random"]):
-        buttons.append([InlineKeyboardButton(text=text, callback_data=f"fb:{section}:{value}:{place_id}")])
+        data = f"fb:{section}:{value}:{place_id}"
+        buttons.append([InlineKeyboardButton(text=text, callback_data=data)])
     buttons.append([InlineKeyboardButton(text="⬅ Закрити", callback_data="fb_close")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
@@ -363,13 +282,38 @@ def build_place_keyboard(place: dict, section: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def build_route_keyboard(
+    places: list[dict], sections: list[str]
+) -> InlineKeyboardMarkup:
+    buttons = []
+    for i, (place, section) in enumerate(zip(places, sections, strict=True), 1):
+        place_id = place.get("place_id", "")
+        row = [InlineKeyboardButton(text=f"{i}. 🗺", url=place["url"])]
+        if place_id:
+            row += [
+                InlineKeyboardButton(text="👍", callback_data=f"vote:like:{place_id}"),
+                InlineKeyboardButton(
+                    text="👎", callback_data=f"vote:dislike:{place_id}"
+                ),
+                InlineKeyboardButton(text="❤️", callback_data=f"save:{place_id}"),
+                InlineKeyboardButton(
+                    text="🛠", callback_data=f"rate:{section}:{place_id}"
+                ),
+            ]
+        buttons.append(row)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 def build_route_end_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="💛 Підтримати", url=PUMB_URL)],
         [
             InlineKeyboardButton(
     text="📤 Поділитися",
-    url=f"https://t.me/share/url?url={BOT_LINK}&text=🔥 Спробуй цей бот для прогулянок по Одесі"
+    url=(
+        f"https://t.me/share/url?url={BOT_LINK}"
+        "&text=🔥 Спробуй цей бот для прогулянок по Одесі"
+    ),
 ),
             InlineKeyboardButton(text="📸 Instagram", url=INSTAGRAM_URL),
         ],
@@ -392,28 +336,157 @@ def feedback_rating_keyboard() -> InlineKeyboardMarkup:
     ])
 
 
-async def send_place_card(message: Message, place: dict, index: int | None = None, section: str = "random"):
-    title = f"<b>{index}. {place['name']}</b>" if index is not None else f"<b>{place['name']}</b>"
+def build_place_caption(place: dict, index: int | None = None) -> str:
+    name = place["name"] if index is None else f"{index}. {place['name']}"
+    title = f"<b>{name}</b>"
     caption = title + "\n"
     if place.get("rating"):
         caption += f"⭐ {place['rating']} ({place.get('reviews', 0)} відгуків)\n"
     if place.get("address"):
         caption += place["address"]
+    return caption
 
+
+async def send_place_card(
+    message: Message,
+    place: dict,
+    index: int | None = None,
+    section: str = "random",
+    after: asyncio.Task | None = None,
+) -> Message:
+    caption = build_place_caption(place, index)
     kb = build_place_keyboard(place, section)
+    # Картку готуємо одразу, а відправляємо лише після підтвердження попередньої
+    if after is not None:
+        await after
     if place.get("photo"):
-        await message.answer_photo(place["photo"], caption=caption, reply_markup=kb)
+        sent = await send_place_photo(message, place, caption, kb)
     else:
-        await message.answer(caption, reply_markup=kb)
+        sent = await message.answer(caption, reply_markup=kb)
 
     if place.get("place_id"):
         save_shown_place_to_sheets(message.from_user.id, place)
+    return sent
+
+
+async def send_place_photo(
+    message: Message, place: dict, caption: str, kb: InlineKeyboardMarkup
+) -> Message:
+    place_id = place.get("place_id")
+    file_id = photo_cache.get(place_id)
+    if file_id:
+        try:
+            return await message.answer_photo(file_id, caption=caption, reply_markup=kb)
+        except TelegramBadRequest as e:
+            print("Cached photo rejected:", e)
+            await photo_cache.drop(place_id)
+
+    sent = await message.answer_photo(place["photo"], caption=caption, reply_markup=kb)
+    if place_id and sent.photo:
+        await photo_cache.put(place_id, sent.photo[-1].file_id)
+    return sent
+
+
+async def send_cards_sequential(
+    message: Message, places: list[dict], sections: list[str]
+):
+    for i, (place, section) in enumerate(zip(places, sections, strict=True), 1):
+        await send_place_card(message, place, i, section=section)
+
+
+async def send_cards_concurrent(
+    message: Message, places: list[dict], sections: list[str]
+):
+    # Telegram не гарантує порядок паралельних запитів, тож картки йдуть ланцюжком:
+    # кожна чекає на підтвердження попередньої, а помилка обриває решту ланцюжка
+    tasks: list[asyncio.Task] = []
+    for i, (place, section) in enumerate(zip(places, sections, strict=True), 1):
+        after = tasks[-1] if tasks else None
+        card = send_place_card(message, place, i, section=section, after=after)
+        tasks.append(asyncio.create_task(card))
+    await asyncio.gather(*tasks)
+
+
+async def send_cards_album(message: Message, places: list[dict], sections: list[str]):
+    photo_cards = [(i, p) for i, p in enumerate(places, 1) if p.get("photo")]
+    if len(photo_cards) < 2:
+        return await send_cards_sequential(message, places, sections)
+
+    cached = [photo_cache.get(p.get("place_id")) for _, p in photo_cards]
+    try:
+        sent = await message.answer_media_group([
+            InputMediaPhoto(
+                media=file_id or place["photo"], caption=build_place_caption(place, i)
+            )
+            for file_id, (i, place) in zip(cached, photo_cards, strict=True)
+        ])
+    except TelegramBadRequest as e:
+        if not any(cached):
+            raise
+        # Якийсь із збережених file_id більше не дійсний — скидаємо їх і шлемо за URL
+        print("Cached album photo rejected:", e)
+        for file_id, (_, place) in zip(cached, photo_cards, strict=True):
+            if file_id:
+                await photo_cache.drop(place["place_id"])
+        cached = [None] * len(photo_cards)
+        sent = await message.answer_media_group([
+            InputMediaPhoto(media=place["photo"], caption=build_place_caption(place, i))
+            for i, place in photo_cards
+        ])
+    for msg, file_id, (_, place) in zip(sent, cached, photo_cards, strict=False):
+        if not file_id and place.get("place_id") and msg.photo:
+            await photo_cache.put(place["place_id"], msg.photo[-1].file_id)
+
+    # Картки без фото та кнопки для всіх точок — одним наступним повідомленням
+    text_cards = [
+        build_place_caption(p, i)
+        for i, p in enumerate(places, 1)
+        if not p.get("photo")
+    ]
+    text = "\n\n".join(text_cards) if text_cards else "Кнопки для точок маршруту 👇"
+    await message.answer(text, reply_markup=build_route_keyboard(places, sections))
+
+    for place in places:
+        if place.get("place_id"):
+            save_shown_place_to_sheets(message.from_user.id, place)
+
+
+def format_walk(meters: float) -> str:
+    if meters < 1000:
+        return f"🚶 Загалом пішки: ~{round(meters, -1):.0f} м"
+    return f"🚶 Загалом пішки: ~{meters / 1000:.1f} км"
+
+
+async def send_route_map(message: Message, map_task: asyncio.Task | None):
+    if map_task is None:
+        return
+    image = await map_task
+    if image:
+        photo = BufferedInputFile(image, filename="route.jpg")
+        await message.answer_photo(photo, caption="🗺 Маршрут на мапі")
+
+
+async def deliver_route(message: Message, places: list[dict], sections: list[str]):
+    # Мапа вантажиться паралельно з картками і йде одразу після них
+    map_task = None
+    if route_map_enabled and len(places) > 1:
+        points = [(p["lat"], p["lon"]) for p in places]
+        map_task = asyncio.create_task(route_map(points))
+
+    if ROUTE_DELIVERY == "album":
+        await send_cards_album(message, places, sections)
+    elif ROUTE_DELIVERY == "concurrent":
+        await send_cards_concurrent(message, places, sections)
+    else:
+        await send_cards_sequential(message, places, sections)
+
+    await send_route_map(message, map_task)
 
 
 @dp.message(F.text == "/start")
 async def start_handler(message: Message):
-    save_user(message.from_user.id)
-    save_user_to_sheets(message.from_user)
+    if await save_user(message.from_user.id):
+        save_user_to_sheets(message.from_user)
 
     kb = ReplyKeyboardMarkup(resize_keyboard=True, keyboard=[
         [KeyboardButton(text="🎲 Випадкова рекомендація")],
@@ -422,12 +495,10 @@ async def start_handler(message: Message):
         [KeyboardButton(text="📤 Поділитися ботом")],
         [KeyboardButton(text="ℹ️ Як працює бот?")],
     ])
-    await message.answer("Привіт! Я — бот <b>«Одеса Навмання»</b> 🧭\nОбирай режим 👇", reply_markup=kb)
-
-
-from urllib.parse import quote
+    await message.answer(
+        "Привіт! Я — бот <b>«Одеса Навмання»</b> 🧭\nОбирай режим 👇", reply_markup=kb
+    )
 
-from urllib.parse import quote
 
 @dp.message(F.text == "📤 Поділитися ботом")
 async def share_bot(message: Message):
@@ -445,40 +516,52 @@ async def share_bot(message: Message):
 async def walk_menu(message: Message):
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True, keyboard=[
         [KeyboardButton(text="🎯 Рандом з 3 локацій")],
-        [KeyboardButton(text="🏨 Маршрут «Готелі»"), KeyboardButton(text="🍴 Маршрут «Гастро»")],
+        [
+            KeyboardButton(text="🏨 Маршрут «Готелі»"),
+            KeyboardButton(text="🍴 Маршрут «Гастро»"),
+        ],
         [KeyboardButton(text="🌟 Фірмовий маршрут")],
         [KeyboardButton(text="⬅ Назад")],
     ])
-    await message.answer("Обери тип маршруту для прогулянки Одесою 👇", reply_markup=keyboard)
+    await message.answer(
+        "Обери тип маршруту для прогулянки Одесою 👇", reply_markup=keyboard
+    )
 
 
 @dp.message(F.text.in_({"🏨 Маршрут «Готелі»", "🍴 Маршрут «Гастро»"}))
-async def thematic_handler(message: Message):
+async def thematic_handler(message: Message, state: FSMContext):
     mode = "hotels" if "Готелі" in message.text else "gastro"
-    user_route_state[message.from_user.id] = {"mode": mode, "count": 3, "status": "choose_start"}
+    await state.update_data(route={"mode": mode, "count": 3, "status": "choose_start"})
     kb = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, keyboard=[
         [KeyboardButton(text="🏙 Почнемо в центрі Одеси")],
         [KeyboardButton(text="📍 Почнемо там де ви зараз")],
         [KeyboardButton(text="⬅ Назад")],
     ])
-    await message.answer(f"Ви обрали {message.text}! 👣\nЗвідки почнемо?", reply_markup=kb)
+    await message.answer(
+        f"Ви обрали {message.text}! 👣\nЗвідки почнемо?", reply_markup=kb
+    )
 
 
 @dp.message(F.text == "🌟 Фірмовий маршрут")
-async def firm_route_menu(message: Message):
-    user_route_state[message.from_user.id] = {"mode": "firm", "status": "choose_start"}
+async def firm_route_menu(message: Message, state: FSMContext):
+    await state.update_data(route={"mode": "firm", "status": "choose_start"})
     kb = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, keyboard=[
         [KeyboardButton(text="🏙 Почнемо в центрі Одеси")],
         [KeyboardButton(text="📍 Почнемо там де ви зараз")],
         [KeyboardButton(text="⬅ Назад")],
     ])
-    await message.answer("Фірмовий маршрут: історична точка → магазин → гастро.\nЗвідки почнемо?", reply_markup=kb)
+    await message.answer(
+        "Фірмовий маршрут: історична точка → магазин → гастро.\nЗвідки почнемо?",
+        reply_markup=kb,
+    )
 
 
 @dp.message(F.text.startswith("🎯 Рандом з"))
-async def route_handler(message: Message):
+async def route_handler(message: Message, state: FSMContext):
     count = 3 if "3" in message.text else 5 if "5" in message.text else 10
-    user_route_state[message.from_user.id] = {"mode": "random", "count": count, "status": "choose_start"}
+    await state.update_data(
+        route={"mode": "random", "count": count, "status": "choose_start"}
+    )
     kb = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, keyboard=[
         [KeyboardButton(text="🏙 Почнемо в центрі Одеси")],
         [KeyboardButton(text="📍 Почнемо там де ви зараз")],
@@ -488,8 +571,8 @@ async def route_handler(message: Message):
 
 
 @dp.message(F.text == "🏙 Почнемо в центрі Одеси")
-async def start_from_center(message: Message):
-    data = user_route_state.pop(message.from_user.id, None)
+async def start_from_center(message: Message, state: FSMContext):
+    data = await pop_session(state, "route")
     if not data:
         return await message.answer("Спочатку обери тип маршруту.")
     mode = data.get("mode")
@@ -504,20 +587,24 @@ async def start_from_center(message: Message):
 
 
 @dp.message(F.text == "📍 Почнемо там де ви зараз")
-async def start_from_loc(message: Message):
-    if message.from_user.id not in user_route_state:
+async def start_from_loc(message: Message, state: FSMContext):
+    route = (await state.get_data()).get("route")
+    if not route:
         return await message.answer("Спочатку обери тип маршруту.")
-    user_route_state[message.from_user.id]["status"] = "waiting_location"
+    route["status"] = "waiting_location"
+    await state.update_data(route=route)
     kb = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True, keyboard=[
         [KeyboardButton(text="📌 Надіслати мою геолокацію", request_location=True)],
         [KeyboardButton(text="⬅ Назад")],
     ])
-    await message.answer("Поділись геолокацією для підбору точок поруч 👇", reply_markup=kb)
+    await message.answer(
+        "Поділись геолокацією для підбору точок поруч 👇", reply_markup=kb
+    )
 
 
 @dp.message(F.location)
-async def handle_location(message: Message):
-    data = user_route_state.pop(message.from_user.id, None)
+async def handle_location(message: Message, state: FSMContext):
+    data = await pop_session(state, "route")
     if not data or data.get("status") != "waiting_location":
         return
     lat, lon = message.location.latitude, message.location.longitude
@@ -535,110 +622,125 @@ async def handle_location(message: Message):
         await start_firm_route(message, lat, lon)
 
 
-async def send_route(message: Message, count: int, start_lat=None, start_lon=None, allowed_types=None, section: str = "random"):
+async def send_route(
+    message: Message,
+    count: int,
+    start_lat=None,
+    start_lon=None,
+    allowed_types=None,
+    section: str = "random",
+):
     user_id = message.from_user.id
-    if not can_use_limit(user_id, "walks", DAILY_WALKS_LIMIT):
+    if not await acquire_limit(user_id, "walks", DAILY_WALKS_LIMIT):
         return await message.answer("На сьогодні ліміт прогулянок (3) вичерпано 🚶‍♂️")
 
-    await message.answer("🔄 Шукаю цікаві локації…")
-    visited = load_visited(user_id)
-    places = get_random_places(
-        count,
-        allowed_types=allowed_types,
-        start_lat=start_lat,
-        start_lon=start_lon,
-        excluded_ids=visited,
-        section=section,
-    )
+    # Прогулянка зараховується лише після доставки карток;
+    # будь-який збій до того повертає ліміт
+    try:
+        await message.answer("🔄 Шукаю цікаві локації…")
+        visited = await load_visited(user_id)
+        places = None
+        if start_lat is None and start_lon is None:
+            places = route_pool.pop(section, visited, length=count)
+        if places is None:
+            places = await get_random_places(
+                count,
+                allowed_types=allowed_types,
+                start_lat=start_lat,
+                start_lon=start_lon,
+                excluded_ids=visited,
+                section=section,
+            )
+        if places:
+            # Маршрути без геолокації будуються від центру —
+            # від нього й рахуємо порядок та відстань
+            if start_lat is None or start_lon is None:
+                start_lat, start_lon = CENTER_LAT, CENTER_LON
+            places, walk_m = await asyncio.to_thread(
+                order_route, places, start_lat, start_lon
+            )
+            await deliver_route(message, places, [section] * len(places))
+    except Exception:
+        await release_limit(user_id, "walks")
+        raise
     if not places:
+        await release_limit(user_id, "walks")
         return await message.reply("Локацій не знайдено 😞")
 
-    for i, place in enumerate(places, 1):
-        await send_place_card(message, place, i, section=section)
-
-    add_visited(user_id, [p["place_id"] for p in places if p.get("place_id")])
-    inc_limit(user_id, "walks")
+    await add_visited(user_id, [p["place_id"] for p in places if p.get("place_id")])
 
-    await message.answer("Як вам прогулянка? 😉", reply_markup=build_route_end_keyboard())
+    await message.answer(
+        f"Як вам прогулянка? 😉\n{format_walk(walk_m)}",
+        reply_markup=build_route_end_keyboard(),
+    )
 
 
 async def start_firm_route(message: Message, start_lat=None, start_lon=None):
     user_id = message.from_user.id
-    if not can_use_limit(user_id, "walks", DAILY_WALKS_LIMIT):
+    if not await acquire_limit(user_id, "walks", DAILY_WALKS_LIMIT):
         return await message.answer("Ліміт вичерпано 🚶‍♂️")
 
-    await message.answer("🔄 Створюю фірмовий маршрут…")
-    visited = load_visited(user_id)
+    try:
+        await message.answer("🔄 Створюю фірмовий маршрут…")
+        visited = await load_visited(user_id)
 
-    first_list = get_random_places(
-        1,
-        allowed_types=HISTORICAL_TYPES,
-        start_lat=start_lat,
-        start_lon=start_lon,
-        excluded_ids=visited,
-        section="history",
-    )
-    if not first_list:
-        return await message.answer("Не знайшов історичну точку 😞")
-    first = first_list[0]
-    add_visited(user_id, [first.get("place_id")])
-    await send_place_card(message, first, 1, section="history")
-
-    second = get_random_place_near(
-        first["lat"],
-        first["lon"],
-        radius=900,
-        allowed_types=SHOP_TYPES,
-        excluded_ids=load_visited(user_id),
-        section="shop",
-    )
-    if not second:
-        return await message.answer("Не знайшов магазин поруч 😞")
-    add_visited(user_id, [second.get("place_id")])
-    await send_place_card(message, second, 2, section="shop")
-
-    third = get_random_place_near(
-        second["lat"],
-        second["lon"],
-        radius=900,
-        allowed_types=GASTRO_TYPES,
-        excluded_ids=load_visited(user_id),
-        section="gastro",
-    )
-    if not third:
-        return await message.answer("Не знайшов гастро-точку поруч 😞")
-    add_visited(user_id, [third.get("place_id")])
-    await send_place_card(message, third, 3, section="gastro")
+        route = None
+        if start_lat is None and start_lon is None:
+            route = route_pool.pop("firm", visited)
+        if route is None:
+            route = await build_firm_route(start_lat, start_lon, excluded_ids=visited)
 
-    inc_limit(user_id, "walks")
-    await message.answer("Фірмовий маршрут готовий ✨", reply_markup=build_route_end_keyboard())
+        await add_visited(user_id, [p.get("place_id") for p in route])
+        await deliver_route(message, route, FIRM_SECTIONS[:len(route)])
+    except Exception:
+        await release_limit(user_id, "walks")
+        raise
+
+    if len(route) < len(FIRM_SECTIONS):
+        await release_limit(user_id, "walks")
+        return await message.answer(FIRM_ERRORS[len(route)])
+
+    # Порядок фірмового маршруту (історія → крамниця → гастро) змістовний,
+    # тож лише рахуємо довжину
+    if start_lat is None or start_lon is None:
+        start_lat, start_lon = CENTER_LAT, CENTER_LON
+    walk_m = route_length(route, start_lat, start_lon)
+    await message.answer(
+        f"Фірмовий маршрут готовий ✨\n{format_walk(walk_m)}",
+        reply_markup=build_route_end_keyboard(),
+    )
 
 
 @dp.message(F.text == "🎲 Випадкова рекомендація")
 async def random_recs(message: Message):
-    if not can_use_limit(message.from_user.id, "recs", DAILY_RECS_LIMIT):
+    if not await acquire_limit(message.from_user.id, "recs", DAILY_RECS_LIMIT):
         return await message.answer("Ліміт вичерпано 🎲")
-    await message.answer("🔍 Шукаю цікаве місце…")
-    places = get_random_places(1, excluded_ids=load_visited(message.from_user.id), section="random")
+    try:
+        await message.answer("🔍 Шукаю цікаве місце…")
+        visited = await load_visited(message.from_user.id)
+        places = await get_random_places(1, excluded_ids=visited, section="random")
+        if places:
+            await add_visited(message.from_user.id, [places[0].get("place_id")])
+            await send_place_card(message, places[0], section="random")
+    except Exception:
+        await release_limit(message.from_user.id, "recs")
+        raise
     if not places:
+        await release_limit(message.from_user.id, "recs")
         return await message.reply("Не знайдено 😞")
-    place = places[0]
-    inc_limit(message.from_user.id, "recs")
-    add_visited(message.from_user.id, [place.get("place_id")])
-    await send_place_card(message, place, section="random")
 
 
 @dp.callback_query(F.data.startswith("vote:"))
 async def handle_vote(callback: types.CallbackQuery):
     _, vote_type, place_id = callback.data.split(":")
-    add_place_feedback(place_id, "rating", vote_type, callback.from_user.id)
+    await add_place_feedback(place_id, "rating", vote_type, callback.from_user.id)
     await callback.answer("Збережено 👍")
 
 
 @dp.callback_query(F.data.startswith("save:"))
 async def save_place_handler(callback: types.CallbackQuery):
     place_id = callback.data.split(":")[1]
-    save_place_for_user(callback.from_user.id, place_id)
+    await save_place_for_user(callback.from_user.id, place_id)
     await callback.answer("Збережено ❤️")
 
 
@@ -664,9 +766,7 @@ async def save_feedback_callback(callback: types.CallbackQuery):
     except ValueError:
         return await callback.answer("Помилка", show_alert=True)
 
-    data = load_place_feedback()
-    place_name = data.get(place_id, {}).get("place_name", "")
-    add_place_feedback(place_id, section, value, callback.from_user.id, place_name=place_name)
+    await add_place_feedback(place_id, section, value, callback.from_user.id)
     await callback.answer("Дякую, зберіг ✅")
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer("Дякуємо! Це допоможе очистити базу місць 💛")
@@ -679,25 +779,27 @@ async def close_feedback(callback: types.CallbackQuery):
 
 
 @dp.message(F.text == "✍️ Відгук про бот")
-async def feedback_start(message: Message):
-    user_feedback_state[message.from_user.id] = {"step": "rating"}
+async def feedback_start(message: Message, state: FSMContext):
+    await state.update_data(feedback={"step": "rating"})
     await message.answer("Оцініть бота ⭐", reply_markup=feedback_rating_keyboard())
 
 
 @dp.callback_query(F.data == "leave_feedback")
-async def leave_feedback(callback: types.CallbackQuery):
-    user_feedback_state[callback.from_user.id] = {"step": "rating"}
-    await callback.message.answer("Оцініть бота ⭐", reply_markup=feedback_rating_keyboard())
+async def leave_feedback(callback: types.CallbackQuery, state: FSMContext):
+    await state.update_data(feedback={"step": "rating"})
+    await callback.message.answer(
+        "Оцініть бота ⭐", reply_markup=feedback_rating_keyboard()
+    )
     await callback.answer()
 
 
 @dp.callback_query(F.data.startswith("botrate:"))
-async def bot_rating(callback: types.CallbackQuery):
+async def bot_rating(callback: types.CallbackQuery, state: FSMContext):
     rating = int(callback.data.split(":")[1])
-    user_feedback_state[callback.from_user.id] = {
+    await state.update_data(feedback={
         "step": "text",
         "rating": rating
-    }
+    })
     await callback.message.answer("Напишіть відгук або додайте фото 📸")
     await callback.answer()
 
@@ -717,17 +819,54 @@ async def back(message: Message):
 async def how(message: Message):
     await message.answer(
         "Обирай режим, а я підберу місця Одесою 🧭\n"
-        "Після кожної точки можна оцінити місце, зберегти його або допомогти очистити базу."
+        "Після кожної точки можна оцінити місце, зберегти його "
+        "або допомогти очистити базу."
+    )
+
+
+@dp.message(F.text == "/stats")
+async def stats_handler(message: Message):
+    if message.from_user.id != MY_ID:
+        return
+    cache = get_cache_stats()
+    photos = photo_cache.stats()
+    queue = outbound.stats()
+    await message.answer(
+        f"Користувачів: {len(user_registry)}\n\n"
+        "<b>Кеш Places</b>\n"
+        f"Записів: {cache['size']}\n"
+        f"Влучань / промахів: {cache['hits']} / {cache['misses']} "
+        f"({cache['hit_rate']:.0%})\n"
+        f"Запитів до API: {cache['api_calls']}, "
+        f"в середньому {cache['avg_api_ms']} мс\n\n"
+        "<b>file_id фото</b>\n"
+        f"Записів: {photos['size']}, "
+        f"влучань / промахів: {photos['hits']} / {photos['misses']} "
+        f"({photos['hit_rate']:.0%})\n\n"
+        "<b>Готові маршрути</b>\n"
+        + "\n".join(f"{name}: {size}" for name, size in route_pool.stats().items())
+        + "\n\n<b>Вихідна черга</b>\n"
+        f"Зараз: {queue['queue_depth']} "
+        f"(high {queue['queue_high']}, normal {queue['queue_normal']}, "
+        f"low {queue['queue_low']}), максимум {queue['max_depth']}\n"
+        f"Надіслано: {queue['sent']}, 429: {queue['rate_limited']}, "
+        f"повторів: {queue['retries']}"
+        + "\n\n<b>Найкращі типи (придатних на запит)</b>\n"
+        + "\n".join(
+            f"{section} / {place_type}, до {(band + 1) * BAND_M} м: "
+            f"{rate:.1f} ({calls} запитів)"
+            for (section, place_type, band), calls, rate in type_yield.stats(top=5)
+        )
     )
 
 
 @dp.message()
-async def handle_feedback_message(message: Message):
-    state = user_feedback_state.get(message.from_user.id)
-    if not state:
+async def handle_feedback_message(message: Message, state: FSMContext):
+    feedback = (await state.get_data()).get("feedback")
+    if not feedback:
         return
 
-    if state.get("step") != "text":
+    if feedback.get("step") != "text":
         return
 
     text = message.text or message.caption or ""
@@ -738,17 +877,91 @@ async def handle_feedback_message(message: Message):
         file = await bot.get_file(photo.file_id)
         photo_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
 
-    save_bot_feedback_to_sheets(message.from_user, state["rating"], text, photo_url)
+    save_bot_feedback_to_sheets(message.from_user, feedback["rating"], text, photo_url)
 
-    user_feedback_state.pop(message.from_user.id, None)
+    await pop_session(state, "feedback")
     await message.answer("Дякуємо 💛")
 
 
+def setup_route_pool():
+    # Готові маршрути від центру для кнопки «🏙 Почнемо в центрі Одеси»
+    route_pool.add_section("random", 3, lambda: get_random_places(3, section="random"))
+    route_pool.add_section(
+        "hotels",
+        3,
+        lambda: get_random_places(3, allowed_types=HOTEL_TYPES, section="hotels"),
+    )
+    route_pool.add_section(
+        "gastro",
+        3,
+        lambda: get_random_places(3, allowed_types=GASTRO_TYPES, section="gastro"),
+    )
+    route_pool.add_section("firm", len(FIRM_SECTIONS), build_firm_route)
+
+
+async def on_startup():
+    global catalog_task, route_map_enabled
+    if BOT_MODE == "webhook":
+        await webhook.set_webhook(bot, dp)
+    await asyncio.to_thread(
+        storage.migrate_from_json,
+        USERS_FILE,
+        VISITED_FILE,
+        LIMITS_FILE,
+        SAVED_FILE,
+        FEEDBACK_FILE,
+    )
+    await user_registry.load()
+    await photo_cache.load()
+    await type_yield.load()
+    if ROUTE_MAP == "auto":
+        route_map_enabled = await ensure_basemap()
+    setup_route_pool()
+    if CATALOG_ENABLED:
+        catalog_task = asyncio.create_task(catalog_refresh_loop())
+    sheets_db.sink.start()
+    daily_limits.start()
+    type_yield.start()
+    visited_store.start()
+    route_pool.start()
+
+
+async def on_shutdown():
+    if catalog_task is not None:
+        catalog_task.cancel()
+    route_pool.stop()
+    visited_store.stop()
+    await daily_limits.stop()
+    await type_yield.stop()
+    await photo_cache.save()
+    await sheets_db.sink.stop()
+    await close_http_session()
+    save_nearby_cache()
+
+
+def health() -> dict:
+    return {
+        "mode": BOT_MODE,
+        "route_map": route_map_enabled,
+        "outbound": outbound.stats(),
+        "places_cache": get_cache_stats(),
+        "route_pool": route_pool.stats(),
+        "photo_cache": photo_cache.stats(),
+    }
+
+
 async def main():
     await bot.delete_webhook(drop_pending_updates=True)
     await asyncio.sleep(1)
     await dp.start_polling(bot)
 
 
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        webhook.run_webhook(dp, bot, health)
+    else:
+        asyncio.run(main())
@@ -1,28 +1,219 @@
+import asyncio
+import hashlib
+import io
+import json
+import math
 import os
-import requests
-
-def generate_static_map(locations):
-    api_key = os.environ["GOOGLE_MAPS_API_KEY"]
-    base_url = "https://maps.googleapis.com/maps/api/staticmap?"
-
-    # Створюємо мітки (наприклад: "color:red|label:1|46.4825,30.7233")
-    markers = [f"color:red|label:{i+1}|{lat},{lng}" for i, (lat, lng) in enumerate(locations)]
-    marker_str = "&".join([f"markers={m}" for m in markers])
-
-    # Центруємо на першій точці
-    center = f"{locations[0][0]},{locations[0][1]}"
-
-    params = (
-        f"center={center}&zoom=14&size=600x400&maptype=roadmap&{marker_str}&key={api_key}"
-    )
-    full_url = base_url + params
-
-    # Завантажуємо зображення
-    response = requests.get(full_url)
-    if response.status_code == 200:
-        with open("map.png", "wb") as f:
-            f.write(response.content)
-        return "map.png"
-    else:
-        print("❌ Не вдалося завантажити мапу")
+import sys
+from collections import OrderedDict
+
+import aiohttp
+from PIL import Image, ImageDraw, ImageFont
+
+from places import CENTER_LAT, CENTER_LON, get_http_session
+
+STATIC_MAP_URL = "https://maps.googleapis.com/maps/api/staticmap"
+MAP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+MAP_CACHE_SIZE = 200
+
+# Підкладка центру Одеси: рендериться при старті бота (або python map_image.py basemap),
+# у git не зберігається
+BASEMAP_FILE = os.getenv("BASEMAP_FILE", "odesa_basemap.png")
+BASEMAP_META_FILE = os.getenv("BASEMAP_META_FILE", "odesa_basemap.json")
+BASEMAP_ZOOM = 14
+BASEMAP_SCALE = 2
+MIN_VIEW = (640, 480)
+VIEW_PADDING = 80
+JPEG_QUALITY = 80
+
+_map_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_basemap = None
+
+
+def _markers(locations):
+    # Створюємо мітки (наприклад: "color:red|label:1|46.4825,30.7233");
+    # label — лише один символ
+    markers = []
+    for i, (lat, lng) in enumerate(locations):
+        label = f"label:{i + 1}|" if i < 9 else ""
+        markers.append(f"color:red|{label}{lat:.6f},{lng:.6f}")
+    return markers
+
+
+async def generate_static_map(locations):
+    api_key = os.getenv("GOOGLE_MAPS_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not api_key or not locations:
+        return None
+
+    markers = _markers(locations)
+    key = hashlib.sha1("\n".join(markers).encode()).hexdigest()
+    cached = _map_cache.get(key)
+    if cached is not None:
+        _map_cache.move_to_end(key)
+        return cached
+
+    params = [("size", "600x400"), ("maptype", "roadmap")]
+    if len(locations) == 1:
+        # Одна точка — центруємо на ній; кілька — Google сам підбирає масштаб
+        # під усі мітки
+        params += [("center", f"{locations[0][0]},{locations[0][1]}"), ("zoom", "14")]
+    params += [("markers", m) for m in markers]
+    params.append(("key", api_key))
+
+    try:
+        session = get_http_session()
+        async with session.get(
+            STATIC_MAP_URL, params=params, timeout=MAP_TIMEOUT
+        ) as response:
+            if response.status != 200:
+                print("❌ Не вдалося завантажити мапу:", response.status)
+                return None
+            image = await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print("❌ Не вдалося завантажити мапу:", e)
+        return None
+
+    _map_cache[key] = image
+    while len(_map_cache) > MAP_CACHE_SIZE:
+        _map_cache.popitem(last=False)
+    return image
+
+
+def _world_px(lat, lng, zoom):
+    # Web Mercator у пікселях світу на даному зумі (так само рахує Google Static Maps)
+    size = 256 * 2 ** zoom
+    siny = min(max(math.sin(math.radians(lat)), -0.9999), 0.9999)
+    x = size * (lng + 180) / 360
+    y = size * (0.5 - math.log((1 + siny) / (1 - siny)) / (4 * math.pi))
+    return x, y
+
+
+def _load_basemap():
+    global _basemap
+    if _basemap is None:
+        if not (os.path.exists(BASEMAP_FILE) and os.path.exists(BASEMAP_META_FILE)):
+            _basemap = False
+            return None
+        with open(BASEMAP_META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        image = Image.open(BASEMAP_FILE).convert("RGB")
+        center_x, center_y = _world_px(*meta["center"], meta["zoom"])
+        _basemap = {
+            "image": image,
+            "zoom": meta["zoom"],
+            "scale": meta["scale"],
+            "font": ImageFont.load_default(size=16),
+            "origin": (
+                center_x - image.width / 2 / meta["scale"],
+                center_y - image.height / 2 / meta["scale"],
+            ),
+        }
+    return _basemap or None
+
+
+def _project(basemap, lat, lng):
+    x, y = _world_px(lat, lng, basemap["zoom"])
+    origin_x, origin_y = basemap["origin"]
+    return (x - origin_x) * basemap["scale"], (y - origin_y) * basemap["scale"]
+
+
+def _crop_box(points, width, height):
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    box_w = max(max(xs) - min(xs) + 2 * VIEW_PADDING, MIN_VIEW[0])
+    box_h = max(max(ys) - min(ys) + 2 * VIEW_PADDING, MIN_VIEW[1])
+    left = min(max((max(xs) + min(xs) - box_w) / 2, 0), max(width - box_w, 0))
+    top = min(max((max(ys) + min(ys) - box_h) / 2, 0), max(height - box_h, 0))
+    right = min(left + box_w, width)
+    bottom = min(top + box_h, height)
+    return int(left), int(top), int(right), int(bottom)
+
+
+def _draw_route(basemap, points):
+    image = basemap["image"]
+    left, top, right, bottom = _crop_box(points, image.width, image.height)
+    view = image.crop((left, top, right, bottom))
+    points = [(x - left, y - top) for x, y in points]
+
+    draw = ImageDraw.Draw(view)
+    if len(points) > 1:
+        draw.line(points, fill=(30, 110, 230), width=5, joint="curve")
+    for i, (x, y) in enumerate(points):
+        r = 13
+        draw.ellipse(
+            (x - r, y - r, x + r, y + r), fill=(220, 40, 40), outline="white", width=3
+        )
+        draw.text((x, y), str(i + 1), fill="white", font=basemap["font"], anchor="mm")
+
+    buffer = io.BytesIO()
+    view.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+async def render_route_map(locations):
+    basemap = _load_basemap()
+    if basemap is None or not locations:
         return None
+    points = [_project(basemap, lat, lng) for lat, lng in locations]
+    width, height = basemap["image"].size
+    # Маршрут виходить за межі підкладки — хай малює Google
+    if not all(0 <= x < width and 0 <= y < height for x, y in points):
+        return None
+    return await asyncio.to_thread(_draw_route, basemap, points)
+
+
+async def route_map(locations):
+    image = await render_route_map(locations)
+    if image is None:
+        image = await generate_static_map(locations)
+    return image
+
+
+async def ensure_basemap():
+    """Чи є підкладка для мап маршруту; якщо її немає, а ключ є — рендеримо її раз."""
+    global _basemap
+    if _load_basemap() is not None:
+        return True
+    if not (os.getenv("GOOGLE_MAPS_API_KEY") or os.getenv("GOOGLE_API_KEY")):
+        return False
+    try:
+        await build_basemap()
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        print("❌ Не вдалося побудувати підкладку мапи:", e)
+        return False
+    _basemap = None
+    return _load_basemap() is not None
+
+
+async def build_basemap():
+    api_key = os.getenv("GOOGLE_MAPS_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    params = {
+        "center": f"{CENTER_LAT},{CENTER_LON}",
+        "zoom": BASEMAP_ZOOM,
+        "scale": BASEMAP_SCALE,
+        "size": "640x640",
+        "maptype": "roadmap",
+        "key": api_key,
+    }
+    async with (
+        aiohttp.ClientSession() as session,
+        session.get(STATIC_MAP_URL, params=params, timeout=MAP_TIMEOUT) as response,
+    ):
+        response.raise_for_status()
+        image = Image.open(io.BytesIO(await response.read())).convert("RGB")
+    image.save(BASEMAP_FILE)
+    with open(BASEMAP_META_FILE, "w", encoding="utf-8") as f:
+        meta = {
+            "center": [CENTER_LAT, CENTER_LON],
+            "zoom": BASEMAP_ZOOM,
+            "scale": BASEMAP_SCALE,
+        }
+        json.dump(meta, f)
+    print(f"Basemap saved: {BASEMAP_FILE} {image.size}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["basemap"]:
+        asyncio.run(build_basemap())
+    else:
+        print("Usage: python map_image.py basemap")
@@ -0,0 +1,187 @@
+import asyncio
+import contextlib
+import itertools
+import os
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    EditMessageReplyMarkup,
+    SendMediaGroup,
+    SendMessage,
+    SendPhoto,
+    TelegramMethod,
+)
+from aiogram.methods.base import Response, TelegramType
+
+# Ліміти Telegram: ~30 повідомлень/с на бота і ~1/с на чат з короткими сплесками
+GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+GLOBAL_BURST = int(os.getenv("TG_GLOBAL_BURST", "30"))
+CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+CHAT_BURST = int(os.getenv("TG_CHAT_BURST", "3"))
+MAX_RETRIES = 3
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+HIGH_PRIORITY_METHODS = (AnswerCallbackQuery, EditMessageReplyMarkup)
+NORMAL_PRIORITY_METHODS = (SendMessage, SendPhoto, SendMediaGroup)
+
+ChatId = Union[int, str, None]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def idle(self, now: float) -> bool:
+        return self.wait_time(now) == 0 and self.tokens >= self.capacity
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    def __init__(self):
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._chats: Dict[ChatId, TokenBucket] = {}
+        self._queue: List[Tuple[int, int, ChatId, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.max_depth = 0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        # getUpdates, getFile, setWebhook тощо не є вихідними повідомленнями
+        if chat_id is None and not isinstance(method, AnswerCallbackQuery):
+            return await make_request(bot, method)
+
+        priority = self._priority(method)
+        for attempt in range(MAX_RETRIES + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                self.rate_limited += 1
+                if attempt == MAX_RETRIES:
+                    raise
+                self.retries += 1
+                (self._chat_bucket(chat_id) or self._global).block(e.retry_after)
+
+    @staticmethod
+    def _priority(method: TelegramMethod) -> int:
+        if isinstance(method, HIGH_PRIORITY_METHODS):
+            return PRIORITY_HIGH
+        if isinstance(method, NORMAL_PRIORITY_METHODS):
+            return PRIORITY_NORMAL
+        return PRIORITY_LOW
+
+    def _chat_bucket(self, chat_id: ChatId) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+        return bucket
+
+    async def _acquire(self, chat_id: ChatId, priority: int) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((priority, next(self._seq), chat_id, future))
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self) -> None:
+        while True:
+            now = time.monotonic()
+            delay: Optional[float] = None
+            waiting = []
+            global_blocked = False
+            # За пріоритетом; чат із порожнім відром не затримує інші чати
+            for entry in sorted(self._queue, key=lambda e: (e[0], e[1])):
+                _, _, chat_id, future = entry
+                if future.done():
+                    continue
+                global_wait = self._global.wait_time(now)
+                if global_blocked or global_wait > 0:
+                    global_blocked = True
+                    delay = global_wait if delay is None else min(delay, global_wait)
+                    waiting.append(entry)
+                    continue
+                bucket = self._chat_bucket(chat_id)
+                chat_wait = bucket.wait_time(now) if bucket else 0.0
+                if chat_wait > 0:
+                    delay = chat_wait if delay is None else min(delay, chat_wait)
+                    waiting.append(entry)
+                    continue
+                self._global.take()
+                if bucket:
+                    bucket.take()
+                future.set_result(None)
+            self._queue = waiting
+
+            if len(self._chats) > 1000:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle(now)}
+
+            self._wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+
+    def stats(self) -> Dict:
+        by_priority = {PRIORITY_HIGH: 0, PRIORITY_NORMAL: 0, PRIORITY_LOW: 0}
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                by_priority[priority] += 1
+        return {
+            "queue_depth": sum(by_priority.values()),
+            "queue_high": by_priority[PRIORITY_HIGH],
+            "queue_normal": by_priority[PRIORITY_NORMAL],
+            "queue_low": by_priority[PRIORITY_LOW],
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "chats": len(self._chats),
+        }
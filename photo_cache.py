@@ -0,0 +1,70 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Set
+
+import storage
+
+PHOTO_CACHE_SIZE = int(os.getenv("PHOTO_CACHE_SIZE", "20000"))
+
+
+# place_id -> Telegram file_id першого успішно надісланого фото,
+# щоб Telegram не качав його з Google знову
+class PhotoCache:
+    def __init__(self, max_size: int = PHOTO_CACHE_SIZE):
+        self.max_size = max_size
+        self._ids: "OrderedDict[str, str]" = OrderedDict()
+        # Використані з останнього запису: saved_at у базі оновлюється пачкою,
+        # а не на кожне фото
+        self._touched: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self) -> None:
+        rows = await asyncio.to_thread(storage.load_photo_ids, self.max_size)
+        self._ids = OrderedDict(rows)
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        file_id = self._ids.get(key) if key else None
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._ids.move_to_end(key)
+        self._touched.add(key)
+        self.hits += 1
+        return file_id
+
+    async def put(self, key: str, file_id: str) -> None:
+        if self._ids.get(key) == file_id:
+            return
+        self._ids[key] = file_id
+        self._ids.move_to_end(key)
+        evicted = []
+        while len(self._ids) > self.max_size:
+            evicted.append(self._ids.popitem(last=False)[0])
+        await asyncio.to_thread(
+            storage.save_photo_id, key, file_id, time.time(), evicted
+        )
+        await self.save()
+
+    # Після рестарту витіснення йде за останнім використанням,
+    # а не за порядком додавання
+    async def save(self) -> None:
+        touched = [key for key in self._touched if key in self._ids]
+        self._touched.clear()
+        if touched:
+            await asyncio.to_thread(storage.touch_photo_ids, touched, time.time())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._ids),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    async def drop(self, key: str) -> None:
+        self._ids.pop(key, None)
+        await asyncio.to_thread(storage.delete_photo_id, key)
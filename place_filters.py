@@ -0,0 +1,102 @@
+import re
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+BAD_GASTRO_WORDS = [
+    "магазин", "shop", "store", "market", "маркет", "продукти", "продукты",
+    "пиво", "beer", "алкоголь", "liquor", "wine shop", "mini market", "мінімаркет"
+]
+BAD_HOTEL_WORDS = [
+    "котедж", "коттедж", "cottage", "village", "camp", "base", "база", "кемп",
+    "villa", "вілла", "садиба"
+]
+
+ALWAYS_BLOCKED = {"wrong", "closed"}
+
+# Правила секцій; відсутній рейтинг фільтр за рейтингом проходить,
+# слова шукаються в назві в нижньому регістрі
+SECTION_RULES: Dict[Optional[str], Dict] = {
+    None: {"blocked_decisions": ALWAYS_BLOCKED},
+    "gastro": {
+        "blocked_decisions": ALWAYS_BLOCKED | {"shop"},
+        "min_rating": 4.0,
+        "min_reviews": 15,
+        "blocked_words": BAD_GASTRO_WORDS,
+    },
+    "hotels": {
+        "blocked_decisions": ALWAYS_BLOCKED | {"cottage"},
+        "min_reviews": 5,
+        "blocked_words": BAD_HOTEL_WORDS,
+    },
+    "history": {"blocked_decisions": ALWAYS_BLOCKED},
+    "shop": {"blocked_decisions": ALWAYS_BLOCKED},
+}
+
+DecisionLookup = Callable[[Optional[str]], Optional[str]]
+
+
+class CompiledRule:
+    def __init__(self, rule: Dict):
+        self.blocked_decisions = frozenset(
+            rule.get("blocked_decisions", ALWAYS_BLOCKED)
+        )
+        self.min_rating = rule.get("min_rating")
+        self.min_reviews = rule.get("min_reviews", 0)
+        words = rule.get("blocked_words") or []
+        # Одна альтернатива на всі слова; довші першими,
+        # щоб "wine shop" не ховався за "shop"
+        longest_first = sorted(words, key=len, reverse=True)
+        pattern = "|".join(re.escape(w) for w in longest_first)
+        self.words = re.compile(pattern) if words else None
+
+    def allows(self, item: Dict, decision: Optional[str]) -> bool:
+        if decision in self.blocked_decisions:
+            return False
+        name = (item.get("name", "") or "").lower()
+        if self.words is not None and self.words.search(name):
+            return False
+        rating = item.get("rating", 0)
+        if self.min_rating is not None and rating and rating < self.min_rating:
+            return False
+        return item.get("user_ratings_total", 0) >= self.min_reviews
+
+    def mask(self, items: List[Dict], decisions: List[Optional[str]]) -> np.ndarray:
+        blocked = self.blocked_decisions
+        keep = np.array([d not in blocked for d in decisions], dtype=bool)
+        if self.min_rating is not None:
+            rating = np.array([it.get("rating", 0) or 0 for it in items], dtype=float)
+            keep &= (rating == 0) | (rating >= self.min_rating)
+        if self.min_reviews:
+            reviews = np.array(
+                [it.get("user_ratings_total", 0) for it in items], dtype=float
+            )
+            keep &= reviews >= self.min_reviews
+        if self.words is not None:
+            # Регулярку ганяємо лише по тих, хто пройшов дешеві числові перевірки
+            search = self.words.search
+            for i in np.flatnonzero(keep):
+                if search((items[i].get("name", "") or "").lower()):
+                    keep[i] = False
+        return keep
+
+
+_compiled = {section: CompiledRule(rule) for section, rule in SECTION_RULES.items()}
+
+
+def rule_for(section: Optional[str]) -> CompiledRule:
+    return _compiled.get(section) or _compiled[None]
+
+
+def is_allowed(item: Dict, section: Optional[str], decision: Optional[str]) -> bool:
+    return rule_for(section).allows(item, decision)
+
+
+def filter_batch(
+    items: List[Dict], section: Optional[str], decision_of: DecisionLookup
+) -> List[Dict]:
+    if not items:
+        return []
+    decisions = [decision_of(it.get("place_id")) for it in items]
+    keep = rule_for(section).mask(items, decisions)
+    return [item for item, ok in zip(items, keep, strict=True) if ok]
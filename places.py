@@ -1,12 +1,69 @@
+import asyncio
 import json
 import os
 import random
-from typing import Dict, List, Optional, Set
+import time
+from collections import OrderedDict
+from typing import AbstractSet, Dict, List, Optional, Tuple
 
-import requests
+import aiohttp
+import numpy as np
+
+import catalog
+import place_filters
+import storage
+from geo import distance_m
+from route_order import distances_from
+from type_yield import TypeYield
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-FEEDBACK_FILE = "place_feedback.json"
+
+# legacy — nearbysearch по одному типу;
+# new — Places API (New) searchNearby одним запитом на всі типи
+PLACES_BACKEND = os.getenv("PLACES_BACKEND", "legacy")
+LEGACY_API_URL = os.getenv("PLACES_LEGACY_URL", "https://maps.googleapis.com/maps/api/place")
+NEW_API_URL = os.getenv("PLACES_NEW_URL", "https://places.googleapis.com/v1")
+NEARBY_URL = f"{LEGACY_API_URL}/nearbysearch/json"
+SEARCH_NEARBY_URL = f"{NEW_API_URL}/places:searchNearby"
+# Лише поля, які читають _place_from_item, фільтри й скоринг
+NEW_FIELD_MASK = ",".join([
+    "places.id",
+    "places.displayName",
+    "places.location",
+    "places.rating",
+    "places.userRatingCount",
+    "places.shortFormattedAddress",
+    "places.photos",
+    "places.types",
+])
+NEW_MAX_RESULTS = 20
+NEW_MAX_TYPES = 50
+
+# Спільний пул з'єднань до Google Places
+HTTP_POOL_SIZE = int(os.getenv("PLACES_HTTP_POOL_SIZE", "20"))
+HTTP_KEEPALIVE = 30
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3)
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+# Кеш відповідей nearbysearch: координати прив'язуються до сітки CACHE_GRID градусів
+CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", str(6 * 3600)))
+CACHE_MAX_SIZE = int(os.getenv("PLACES_CACHE_SIZE", "2000"))
+CACHE_GRID = float(os.getenv("PLACES_CACHE_GRID", "0.002"))
+CACHE_FILE = os.getenv("PLACES_CACHE_FILE", "")
+
+# Локальний каталог місць (SQLite), зібраний наперед по сітці Одеси
+CATALOG_ENABLED = os.getenv("PLACES_CATALOG", "1") == "1"
+CATALOG_BOUNDS = tuple(
+    float(v)
+    for v in os.getenv(
+        "PLACES_CATALOG_BOUNDS", "46.455,30.690,46.505,30.765"
+    ).split(",")
+)
+CATALOG_MAX_AGE = int(os.getenv("PLACES_CATALOG_MAX_AGE", str(7 * 24 * 3600)))
+CATALOG_REFRESH_INTERVAL = 600
+HARVEST_RADIUS = 400
+HARVEST_CONCURRENCY = 4
 
 # Центр Одеси
 CENTER_LAT = 46.482952
@@ -14,6 +71,29 @@ CENTER_LON = 30.712481
 
 INITIAL_RADIUS = 700
 MAX_RADIUS = 1000
+MAX_SEARCH_CALLS = 50
+FIRM_STOP_RADIUS = 900
+FIRM_CANDIDATES = 4
+
+# Додаткові сторінки nearbysearch (до 60 результатів) для секцій зі строгими фільтрами
+PAGED_SECTIONS = set(os.getenv("PLACES_PAGED_SECTIONS", "gastro,hotels").split(","))
+PAGE_SIZE = 20
+MAX_PAGES = 3
+PAGE_TOKEN_DELAY = 2.0
+PAGE_TOKEN_RETRIES = 3
+# Google не гарантує життя next_page_token довше кількох хвилин
+PAGE_TOKEN_TTL = 120
+PAGE_MIN_ACCEPTED = 5
+
+# Скільки типів запитувати паралельно за один раунд (1 — послідовний режим)
+FANOUT_TYPES = int(os.getenv("PLACES_FANOUT_TYPES", "4"))
+
+# Відбір зупинок із пулу кандидатів
+POOL_FACTOR = int(os.getenv("PLACES_POOL_FACTOR", "4"))
+SCORE_DISTANCE_M = 500
+SCORE_REVIEWS_CAP = 1000
+DEFAULT_RATING = 4.0
+TYPE_REPEAT_PENALTY = 0.3
 
 # Базові типи для випадкових прогулянок
 ALLOWED_TYPES = [
@@ -28,31 +108,16 @@ ALLOWED_TYPES = [
 HOTEL_TYPES = ["lodging"]
 GASTRO_TYPES = ["restaurant", "cafe", "bar"]
 HISTORICAL_TYPES = ["museum", "tourist_attraction", "church", "synagogue"]
-SHOP_TYPES = ["store", "shopping_mall", "supermarket", "convenience_store", "liquor_store"]
-
-BAD_GASTRO_WORDS = [
-    "магазин", "shop", "store", "market", "маркет", "продукти", "продукты",
-    "пиво", "beer", "алкоголь", "liquor", "wine shop", "mini market", "мінімаркет"
+SHOP_TYPES = [
+    "store", "shopping_mall", "supermarket", "convenience_store", "liquor_store"
 ]
-BAD_HOTEL_WORDS = [
-    "котедж", "коттедж", "cottage", "village", "camp", "base", "база", "кемп",
-    "villa", "вілла", "садиба"
-]
-
-
-def load_place_feedback() -> Dict:
-    try:
-        with open(FEEDBACK_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
+CATALOG_TYPES = sorted(
+    set(ALLOWED_TYPES + HOTEL_TYPES + GASTRO_TYPES + HISTORICAL_TYPES + SHOP_TYPES)
+)
 
-def get_place_feedback(place_id: Optional[str]) -> Dict:
-    if not place_id:
-        return {}
-    data = load_place_feedback()
-    return data.get(place_id, {})
+# place_id -> переможний голос; перечитується лише коли відгуки змінив інший процес
+_decision_index: Dict[str, Optional[str]] = {}
+_feedback_version: Optional[int] = None
 
 
 def _top_vote(votes: Dict[str, int]) -> Optional[str]:
@@ -61,22 +126,517 @@ def _top_vote(votes: Dict[str, int]) -> Optional[str]:
     return max(votes.items(), key=lambda x: x[1])[0]
 
 
+# Раз на пошук маршруту, а не на кожного кандидата
+async def refresh_feedback_index() -> None:
+    global _feedback_version
+    version = await asyncio.to_thread(storage.feedback_version)
+    if version == _feedback_version:
+        return
+    votes = await asyncio.to_thread(storage.load_place_votes)
+    _decision_index.clear()
+    for pid, place_votes in votes.items():
+        _decision_index[pid] = _top_vote(place_votes)
+    _feedback_version = version
+
+
+def update_place_decision(place_id: str, votes: Dict[str, int], version: int) -> None:
+    global _feedback_version
+    if _feedback_version is None:
+        return
+    _decision_index[place_id] = _top_vote(votes)
+    # Якщо між нашими записами були чужі, версію не чіпаємо —
+    # наступний пошук перечитає все
+    if version == _feedback_version + 1:
+        _feedback_version = version
+
+
 def get_place_decision(place_id: Optional[str]) -> Optional[str]:
     if not place_id:
         return None
-    record = get_place_feedback(place_id)
-    return _top_vote(record.get("votes", {}))
+    return _decision_index.get(place_id)
 
 
 def get_photo_url(photo_reference: str, maxwidth: int = 800) -> str:
     if not GOOGLE_API_KEY or not photo_reference:
         return ""
+    # Фото з нового API мають ім'я ресурсу "places/<id>/photos/<ref>"
+    # замість photo_reference
+    if photo_reference.startswith("places/"):
+        return (
+            f"{NEW_API_URL}/{photo_reference}/media"
+            f"?maxWidthPx={maxwidth}&key={GOOGLE_API_KEY}"
+        )
     return (
-        "https://maps.googleapis.com/maps/api/place/photo"
+        f"{LEGACY_API_URL}/photo"
         f"?maxwidth={maxwidth}&photoreference={photo_reference}&key={GOOGLE_API_KEY}"
     )
 
 
+def get_http_session() -> aiohttp.ClientSession:
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            keepalive_timeout=HTTP_KEEPALIVE,
+            ttl_dns_cache=300,
+        )
+        _http_session = aiohttp.ClientSession(connector=connector, timeout=HTTP_TIMEOUT)
+    return _http_session
+
+
+async def close_http_session() -> None:
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+CacheKey = Tuple[float, float, int, str]
+# (час збереження, результати, next_page_token, скільки сторінок уже є,
+# коли видано токен)
+CacheEntry = Tuple[float, List[Dict], Optional[str], int, float]
+
+
+class NearbyCache:
+    def __init__(self, ttl: int, max_size: int, path: str = ""):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+        self.api_time = 0.0
+        self._data: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+
+    def get(self, key: CacheKey) -> Optional[List[Dict]]:
+        entry = self._data.get(key)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return list(entry[1])
+
+    def set(
+        self,
+        key: CacheKey,
+        results: List[Dict],
+        next_token: Optional[str] = None,
+        pages: int = 1,
+        token_at: float = 0.0,
+    ) -> None:
+        entry = self._data.get(key)
+        # Дочитані сторінки не продовжують життя запису:
+        # перша сторінка старіє як і раніше
+        saved_at = entry[0] if entry is not None and pages > 1 else time.time()
+        self._data[key] = (saved_at, results, next_token, pages, token_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def next_page(self, key: CacheKey) -> Tuple[Optional[str], float, int]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None, 0.0, 0
+        _, _, token, pages, token_at = entry
+        if token is None or time.time() - token_at > PAGE_TOKEN_TTL:
+            return None, 0.0, pages
+        return token, token_at, pages
+
+    def record_call(self, elapsed: float) -> None:
+        self.api_calls += 1
+        self.api_time += elapsed
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "api_calls": self.api_calls,
+            "avg_api_ms": (
+                round(self.api_time * 1000 / self.api_calls) if self.api_calls else 0
+            ),
+        }
+
+    def load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception:
+            return
+        now = time.time()
+        for row in raw:
+            lat, lon, radius, place_type, saved_at, results, *rest = row
+            pages = rest[0] if rest else 1
+            if now - saved_at <= self.ttl:
+                key = (lat, lon, radius, place_type)
+                self._data[key] = (saved_at, results, None, pages, 0.0)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        # next_page_token живе лише кілька хвилин,
+        # тож після рестарту дочитування не буде
+        raw = [
+            [*key, saved_at, results, pages]
+            for key, (saved_at, results, _, pages, _) in self._data.items()
+        ]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(raw, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+type_yield = TypeYield()
+nearby_cache = NearbyCache(CACHE_TTL, CACHE_MAX_SIZE, CACHE_FILE)
+nearby_cache.load()
+_inflight: Dict[Tuple, "asyncio.Future[List[Dict]]"] = {}
+
+
+class _FlightAborted(Exception):
+    """Власник спільного запиту не дочекався відповіді; чекачі мають зробити власний."""
+
+
+def _snap(value: float) -> float:
+    return round(round(value / CACHE_GRID) * CACHE_GRID, 6)
+
+
+def get_cache_stats() -> Dict:
+    return nearby_cache.stats()
+
+
+def save_nearby_cache() -> None:
+    try:
+        nearby_cache.save()
+    except Exception as e:
+        print("Places cache save error:", e)
+
+
+async def _request_nearby(params: Dict, place_type: str) -> Optional[Dict]:
+    started = time.perf_counter()
+    try:
+        async with get_http_session().get(NEARBY_URL, params=params) as resp:
+            return await resp.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        print(f"Places nearbysearch error [{place_type}]:", e)
+        return None
+    finally:
+        nearby_cache.record_call(time.perf_counter() - started)
+
+
+async def _next_page(token: str, token_at: float, place_type: str) -> Optional[Dict]:
+    # next_page_token стає дійсним лише через ~2 с;
+    # до того Google відповідає INVALID_REQUEST
+    params = {"pagetoken": token, "key": GOOGLE_API_KEY}
+    for _ in range(PAGE_TOKEN_RETRIES):
+        await asyncio.sleep(max(0.0, token_at + PAGE_TOKEN_DELAY - time.time()))
+        data = await _request_nearby(params, place_type)
+        if data is None:
+            return None
+        if data.get("status") != "INVALID_REQUEST":
+            return data
+        # Старий токен, який Google відкинув, уже не оживе
+        if time.time() - token_at > PAGE_TOKEN_DELAY * PAGE_TOKEN_RETRIES:
+            return None
+        token_at = time.time()
+    return None
+
+
+async def _fetch_nearby(
+    lat: float, lon: float, radius: int, place_type: str
+) -> Optional[Tuple[List[Dict], Optional[str]]]:
+    params = {
+        "location": f"{lat},{lon}",
+        "radius": radius,
+        "type": place_type,
+        "key": GOOGLE_API_KEY,
+    }
+    data = await _request_nearby(params, place_type)
+    if data is None:
+        return None
+    if data.get("status") not in ("OK", "ZERO_RESULTS"):
+        print(f"Places nearbysearch status [{place_type}]:", data.get("status"))
+        return None
+    return list(data.get("results", [])), data.get("next_page_token")
+
+
+async def _fetch_more(
+    token: Optional[str], token_at: float, place_type: str, pages: int
+) -> Tuple[List[Dict], Optional[str], float, int]:
+    results: List[Dict] = []
+    fetched = 0
+    while token and fetched < pages:
+        data = await _next_page(token, token_at, place_type)
+        # Невдала наступна сторінка не скасовує вже отримані, але й далі не читаємо
+        if data is None or data.get("status") != "OK":
+            return results, None, 0.0, fetched
+        results.extend(data.get("results", []))
+        token, token_at = data.get("next_page_token"), time.time()
+        fetched += 1
+    return results, token, token_at, fetched
+
+
+def _item_from_new(place: Dict) -> Dict:
+    # Відповідь нового API у форму елемента nearbysearch,
+    # яку розуміють кеш, каталог і фільтри
+    location = place.get("location", {})
+    lat, lng = location.get("latitude"), location.get("longitude")
+    item = {
+        "place_id": place.get("id"),
+        "name": place.get("displayName", {}).get("text", "Без назви"),
+        "geometry": {"location": {"lat": lat, "lng": lng}},
+        "user_ratings_total": place.get("userRatingCount", 0),
+        "vicinity": place.get("shortFormattedAddress", ""),
+        "types": place.get("types", []),
+    }
+    if place.get("rating") is not None:
+        item["rating"] = place["rating"]
+    if place.get("photos"):
+        item["photos"] = [{"photo_reference": place["photos"][0].get("name")}]
+    return item
+
+
+async def _fetch_search_nearby(
+    lat: float, lon: float, radius: int, types: List[str]
+) -> Optional[List[Dict]]:
+    body = {
+        "includedTypes": types[:NEW_MAX_TYPES],
+        "maxResultCount": NEW_MAX_RESULTS,
+        "locationRestriction": {
+            "circle": {
+                "center": {"latitude": lat, "longitude": lon},
+                "radius": float(radius),
+            },
+        },
+    }
+    headers = {"X-Goog-Api-Key": GOOGLE_API_KEY, "X-Goog-FieldMask": NEW_FIELD_MASK}
+    started = time.perf_counter()
+    try:
+        session = get_http_session()
+        async with session.post(SEARCH_NEARBY_URL, json=body, headers=headers) as resp:
+            data = await resp.json(content_type=None)
+            status = resp.status
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        print("Places searchNearby error:", e)
+        return None
+    finally:
+        nearby_cache.record_call(time.perf_counter() - started)
+
+    if status != 200:
+        message = (data or {}).get("error", {}).get("message")
+        print("Places searchNearby status:", status, message)
+        return None
+    return [
+        _item_from_new(place)
+        for place in data.get("places", [])
+        if place.get("id") and place.get("location")
+    ]
+
+
+def _matched_type(item: Dict, types: List[str]) -> str:
+    for t in item.get("types", []):
+        if t in types:
+            return t
+    return types[0]
+
+
+async def _search_nearby_all(
+    lat: float, lon: float, radius: int, types: List[str]
+) -> Optional[List[Tuple[str, Dict]]]:
+    """Один запит searchNearby на весь пул типів.
+
+    Повертає пари (тип, елемент) або None, якщо новий бекенд недоступний.
+    """
+    key = (_snap(lat), _snap(lon), radius, "new:" + ",".join(sorted(types)))
+    results = nearby_cache.get(key)
+    if results is None:
+        results = await _fetch_search_nearby(key[0], key[1], radius, types)
+        if results is None:
+            return None
+        nearby_cache.set(key, results)
+        if CATALOG_ENABLED:
+            by_type: Dict[str, List[Dict]] = {}
+            for item in results:
+                by_type.setdefault(_matched_type(item, types), []).append(item)
+            for place_type, items in by_type.items():
+                await asyncio.to_thread(catalog.store, items, place_type)
+    return [(_matched_type(item, types), item) for item in results]
+
+
+async def _search_types(
+    lat: float,
+    lon: float,
+    radius: int,
+    types: List[str],
+    section: Optional[str],
+    wanted: int,
+) -> List[List[Dict]]:
+    """Придатні місця по кожному типу.
+
+    Наступні сторінки читаються лише тоді, коли перші дали менше за wanted.
+    """
+    found = await asyncio.gather(*(_lookup_nearby(lat, lon, radius, t) for t in types))
+    results = [items for items, _ in found]
+    accepted = [_accepted(items, section) for items, _ in found]
+    # У статистику типу йдуть лише справжні запити до API, не кеш і не каталог
+    for t, (_, fetched), allowed in zip(types, found, accepted, strict=True):
+        if fetched:
+            type_yield.record(section, t, radius, len(allowed))
+    # Кожна наступна сторінка коштує ~2 с очікування токена
+    if section in PAGED_SECTIONS and sum(len(a) for a in accepted) < wanted:
+        more = await asyncio.gather(
+            *(_nearby_search(lat, lon, radius, t, more=True) for t in types)
+        )
+        for i, items in enumerate(more):
+            if len(items) > len(results[i]):
+                accepted[i] = _accepted(items, section)
+    return accepted
+
+
+async def _nearby_search(
+    lat: float, lon: float, radius: int, place_type: str, more: bool = False
+) -> List[Dict]:
+    """Перша сторінка nearbysearch; з more=True ще й решта, якщо Google їх має."""
+    results, _ = await _lookup_nearby(lat, lon, radius, place_type, more)
+    return results
+
+
+async def _lookup_nearby(
+    lat: float, lon: float, radius: int, place_type: str, more: bool = False
+) -> Tuple[List[Dict], bool]:
+    # Друге значення — чи цей виклик сам отримав першу сторінку від API
+    if CATALOG_ENABLED:
+        local = await asyncio.to_thread(catalog.nearby, lat, lon, radius, place_type)
+        if local is not None:
+            return local, False
+
+    key = (_snap(lat), _snap(lon), radius, place_type)
+    cached = nearby_cache.get(key)
+    if cached is not None:
+        token, _, pages = nearby_cache.next_page(key)
+        if not more or not token or pages >= MAX_PAGES:
+            return cached, False
+
+    # Однакові запити, що вже летять, чекають на одну відповідь
+    flight = (*key, more)
+    pending = _inflight.get(flight)
+    while pending is not None:
+        try:
+            return list(await asyncio.shield(pending)), False
+        except _FlightAborted:
+            # Власника запиту скасували або він впав — робимо власний;
+            # власне скасування летить далі
+            pending = _inflight.get(flight)
+
+    future = asyncio.get_running_loop().create_future()
+    # Позначаємо виняток прочитаним, навіть якщо чекачів не було
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[flight] = future
+    try:
+        results, fetched = await _load_nearby(key, place_type, cached, more)
+        future.set_result(results)
+    except BaseException:
+        future.set_exception(_FlightAborted())
+        raise
+    finally:
+        _inflight.pop(flight, None)
+    return list(results), fetched
+
+
+async def _load_nearby(
+    key: CacheKey, place_type: str, cached: Optional[List[Dict]], more: bool
+) -> Tuple[List[Dict], bool]:
+    if cached is None:
+        page = await _fetch_nearby(key[0], key[1], key[2], place_type)
+        if page is None:
+            return [], False
+        results, token = page
+        token_at = time.time()
+        pages = 1
+        fresh = results
+    else:
+        results = cached
+        token, token_at, pages = nearby_cache.next_page(key)
+        fresh = []
+    if more and token:
+        extra, token, token_at, fetched = await _fetch_more(
+            token, token_at, place_type, MAX_PAGES - pages
+        )
+        results = results + extra
+        pages += fetched
+        fresh = fresh + extra
+    nearby_cache.set(key, results, token, pages, token_at)
+    if CATALOG_ENABLED and fresh:
+        await asyncio.to_thread(catalog.store, fresh, place_type)
+    return results, cached is None
+
+
+async def _harvest_cell(
+    cell_y: int, cell_x: int, place_type: str, semaphore: asyncio.Semaphore
+) -> bool:
+    lat, lon = catalog.cell_center(cell_y, cell_x)
+    async with semaphore:
+        page = await _fetch_nearby(lat, lon, HARVEST_RADIUS, place_type)
+        if page is None:
+            return False
+        results, token = page
+        if place_type in GASTRO_TYPES or place_type in HOTEL_TYPES:
+            extra, _, _, _ = await _fetch_more(
+                token, time.time(), place_type, MAX_PAGES - 1
+            )
+            results += extra
+    await asyncio.to_thread(catalog.store, results, place_type)
+    await asyncio.to_thread(catalog.mark_covered, cell_y, cell_x, place_type)
+    return True
+
+
+async def harvest_catalog(
+    types: Optional[List[str]] = None, bounds: Tuple[float, ...] = CATALOG_BOUNDS
+) -> int:
+    semaphore = asyncio.Semaphore(HARVEST_CONCURRENCY)
+    jobs = [
+        _harvest_cell(cell_y, cell_x, t, semaphore)
+        for t in types or CATALOG_TYPES
+        for cell_y, cell_x in catalog.cells_in_bounds(*bounds)
+    ]
+    done = await asyncio.gather(*jobs)
+    return sum(done)
+
+
+async def catalog_refresh_loop() -> None:
+    semaphore = asyncio.Semaphore(HARVEST_CONCURRENCY)
+    while True:
+        await asyncio.sleep(CATALOG_REFRESH_INTERVAL)
+        try:
+            stale = await asyncio.to_thread(catalog.stale_cells, CATALOG_MAX_AGE)
+            await asyncio.gather(
+                *(_harvest_cell(y, x, t, semaphore) for t, y, x in stale)
+            )
+        except Exception as e:
+            print("Catalog refresh error:", e)
+
+
+def _merge_results(results: List[List[Dict]]) -> List[Dict]:
+    merged: List[Dict] = []
+    seen = set()
+    for items in results:
+        for item in items:
+            pid = item.get("place_id")
+            if pid in seen:
+                continue
+            seen.add(pid)
+            merged.append(item)
+    return merged
+
+
 def _place_from_item(item: Dict) -> Dict:
     plat = item["geometry"]["location"]["lat"]
     plon = item["geometry"]["location"]["lng"]
@@ -100,157 +660,254 @@ def _place_from_item(item: Dict) -> Dict:
     }
 
 
-def _contains_bad_word(name: str, words: List[str]) -> bool:
-    low = (name or "").lower()
-    return any(word in low for word in words)
-
-
 def is_place_allowed(item: Dict, section: Optional[str] = None) -> bool:
-    pid = item.get("place_id")
-    decision = get_place_decision(pid)
-    name = item.get("name", "")
+    decision = get_place_decision(item.get("place_id"))
+    return place_filters.is_allowed(item, section, decision)
 
-    if decision in {"wrong", "closed"}:
-        return False
 
-    if section == "gastro":
-        if decision in {"shop", "wrong", "closed"}:
-            return False
-        if _contains_bad_word(name, BAD_GASTRO_WORDS):
-            return False
-        if item.get("rating", 0) and item.get("rating", 0) < 4.0:
-            return False
-        if item.get("user_ratings_total", 0) < 15:
-            return False
+def filter_places(items: List[Dict], section: Optional[str] = None) -> List[Dict]:
+    return place_filters.filter_batch(items, section, get_place_decision)
 
-    if section == "hotels":
-        if decision in {"cottage", "wrong", "closed"}:
-            return False
-        if _contains_bad_word(name, BAD_HOTEL_WORDS):
-            return False
-        if item.get("user_ratings_total", 0) < 5:
-            return False
 
-    if section == "history":
-        if decision in {"wrong", "closed"}:
-            return False
+def _accepted(items: List[Dict], section: Optional[str]) -> List[Dict]:
+    # Придатні місця однієї відповіді: з place_id, відгуками і через фільтри секції
+    fresh = [
+        item for item in items
+        if item.get("place_id") and item.get("user_ratings_total", 0) > 0
+    ]
+    return filter_places(fresh, section=section)
 
-    if section == "shop":
-        if decision in {"wrong", "closed"}:
-            return False
 
-    return True
+def _score_candidates(items: List[Dict], lat: float, lon: float) -> np.ndarray:
+    # Вага кожного кандидата одним векторним проходом:
+    # близькість × рейтинг × кількість відгуків
+    locations = [it["geometry"]["location"] for it in items]
+    coords = np.array([(loc["lat"], loc["lng"]) for loc in locations])
+    dist = distances_from(lat, lon, coords)
+    rating = np.array([it.get("rating") or DEFAULT_RATING for it in items], dtype=float)
+    reviews = np.array([it.get("user_ratings_total", 0) for it in items], dtype=float)
+    closeness = np.exp(-dist / SCORE_DISTANCE_M)
+    quality = (rating / 5) ** 2
+    popularity = np.minimum(np.log1p(reviews) / np.log1p(SCORE_REVIEWS_CAP), 1.0)
+    return closeness * quality * (0.3 + 0.7 * popularity)
 
 
-def get_random_places(
+def _select_from_pool(
+    pool: List[Tuple[str, Dict]], n: int, lat: float, lon: float
+) -> List[Dict]:
+    items = [item for _, item in pool]
+    types = np.array([t for t, _ in pool])
+    weights = _score_candidates(items, lat, lon)
+    available = np.ones(len(items), dtype=bool)
+    # Скільки разів уже взято кожен тип кандидата:
+    # штраф накопичується за всі попередні вибори
+    repeats = np.zeros(len(items))
+    picked: List[Dict] = []
+    while len(picked) < n and available.any():
+        w = np.where(available, weights * TYPE_REPEAT_PENALTY ** repeats, 0.0)
+        total = w.sum()
+        if total <= 0:
+            idx = int(np.flatnonzero(available)[0])
+        else:
+            idx = random.choices(range(len(w)), weights=w)[0]
+        place = _place_from_item(items[idx])
+        picked.append(place)
+        available[idx] = False
+        # Наступна зупинка тягнеться до поточної, а вже взятий тип стає менш імовірним
+        weights = _score_candidates(items, place["lat"], place["lon"])
+        repeats[types == types[idx]] += 1
+    return picked
+
+
+async def get_random_places(
     n: int = 3,
     allowed_types: Optional[List[str]] = None,
     start_lat: Optional[float] = None,
     start_lon: Optional[float] = None,
-    excluded_ids: Optional[Set[str]] = None,
+    excluded_ids: Optional[AbstractSet[str]] = None,
     section: Optional[str] = None,
+    fanout: Optional[int] = None,
 ) -> List[Dict]:
     if not GOOGLE_API_KEY:
         return []
 
     excluded_ids = excluded_ids or set()
+    await refresh_feedback_index()
     types_pool = allowed_types or ALLOWED_TYPES
-    all_places: List[Dict] = []
-    used_ids = set()
+    fanout = max(1, fanout or FANOUT_TYPES)
+    pool: List[Tuple[str, Dict]] = []
+    seen_ids = set()
     used_types = set()
 
     base_lat = start_lat if start_lat is not None else CENTER_LAT
     base_lon = start_lon if start_lon is not None else CENTER_LON
 
-    current_lat, current_lon, radius = base_lat, base_lon, INITIAL_RADIUS
+    radius = INITIAL_RADIUS
     attempts = 0
 
-    while len(all_places) < n and attempts < 50:
-        attempts += 1
+    target = n * POOL_FACTOR
+    if PLACES_BACKEND == "new":
+        found = await _search_nearby_all(base_lat, base_lon, radius, list(types_pool))
+        if found is not None:
+            typed = {item["place_id"]: place_type for place_type, item in found}
+            fresh = [
+                item for _, item in found
+                if item["place_id"] not in excluded_ids
+                and item.get("user_ratings_total", 0) > 0
+            ]
+            for item in filter_places(fresh, section=section):
+                seen_ids.add(item["place_id"])
+                pool.append((typed[item["place_id"]], item))
+            # Один запит уже покрив усі типи;
+            # legacy лише докидає, якщо не вистачає на сам маршрут
+            target = n
+
+    # Збираємо всіх придатних кандидатів у спільний пул,
+    # доки їх не стане з запасом на n зупинок
+    while len(pool) < target and attempts < MAX_SEARCH_CALLS:
         choices = list(set(types_pool) - used_types) or types_pool
-        t = random.choice(choices)
-        used_types.add(t)
-
-        resp = requests.get(
-            "https://maps.googleapis.com/maps/api/place/nearbysearch/json",
-            params={
-                "location": f"{current_lat},{current_lon}",
-                "radius": radius,
-                "type": t,
-                "key": GOOGLE_API_KEY,
-            },
-            timeout=10,
-        ).json()
-
-        candidates = resp.get("results", [])
-        random.shuffle(candidates)
-
-        picked = False
-        for item in candidates:
-            pid = item.get("place_id")
-            if not pid or pid in used_ids or pid in excluded_ids:
-                continue
-            if item.get("user_ratings_total", 0) <= 0:
-                continue
-            if not is_place_allowed(item, section=section):
-                continue
-
-            place = _place_from_item(item)
-            all_places.append(place)
-            used_ids.add(pid)
-            current_lat, current_lon = place["lat"], place["lon"]
-            picked = True
-            break
-
-        if not picked and radius < MAX_RADIUS:
+        k = min(fanout, MAX_SEARCH_CALLS - attempts)
+        batch = type_yield.sample(section, choices, radius, k)
+        attempts += len(batch)
+        used_types.update(batch)
+
+        # Сторінки дочитуємо лише тоді, коли бракує на сам маршрут, а не на запас пулу
+        accepted = await _search_types(
+            base_lat, base_lon, radius, batch, section, n - len(pool)
+        )
+        added = 0
+        for place_type, items in zip(batch, accepted, strict=True):
+            for item in items:
+                pid = item["place_id"]
+                if pid in seen_ids or pid in excluded_ids:
+                    continue
+                seen_ids.add(pid)
+                pool.append((place_type, item))
+                added += 1
+
+        if radius >= MAX_RADIUS:
+            # Пошук вичерпано: усі типи вже спробувано на максимальному радіусі
+            # або раунд нічого не додав
+            if set(types_pool) <= used_types or (not added and len(pool) >= n):
+                break
+        elif not added:
             radius = min(radius + 100, MAX_RADIUS)
+            # На новому радіусі знову пробуємо всі типи
+            used_types.clear()
 
-    return all_places[:n]
+    if not pool:
+        return []
+    return _select_from_pool(pool, n, base_lat, base_lon)
 
 
-def get_random_place_near(
+async def _collect_candidates(
     lat: float,
     lon: float,
-    radius: int = 700,
-    allowed_types: Optional[List[str]] = None,
-    excluded_ids: Optional[Set[str]] = None,
-    section: Optional[str] = None,
-) -> Optional[Dict]:
+    radius: int,
+    types: List[str],
+    excluded_ids: AbstractSet[str],
+    section: str,
+) -> List[Dict]:
+    found = None
+    if PLACES_BACKEND == "new":
+        found = await _search_nearby_all(lat, lon, radius, types)
+    if found is not None:
+        fresh = [item for _, item in found if item.get("user_ratings_total", 0) > 0]
+        accepted = [filter_places(fresh, section=section)]
+    else:
+        accepted = await _search_types(
+            lat, lon, radius, types, section, PAGE_MIN_ACCEPTED
+        )
+    places = [
+        _place_from_item(item)
+        for item in _merge_results(accepted)
+        if item["place_id"] not in excluded_ids
+    ]
+    random.shuffle(places)
+    return places
+
+
+async def _firm_chain(first: Dict, excluded_ids: AbstractSet[str]) -> List[Dict]:
+    # Магазини й гастро навколо історичної точки шукаємо одночасно,
+    # а пару підбираємо вже локально
+    lat, lon = first["lat"], first["lon"]
+    shops, gastros = await asyncio.gather(
+        _collect_candidates(
+            lat, lon, FIRM_STOP_RADIUS, SHOP_TYPES, excluded_ids, "shop"
+        ),
+        _collect_candidates(
+            lat, lon, FIRM_STOP_RADIUS * 2, GASTRO_TYPES, excluded_ids, "gastro"
+        ),
+    )
+    shops = [p for p in shops if p["place_id"] != first["place_id"]]
+    for shop in shops:
+        options = [
+            g for g in gastros
+            if g["place_id"] not in (first["place_id"], shop["place_id"])
+            and distance_m(shop["lat"], shop["lon"], g["lat"], g["lon"])
+            <= FIRM_STOP_RADIUS
+        ]
+        if options:
+            return [first, shop, random.choice(options)]
+    return [first, shops[0]] if shops else [first]
+
+
+async def build_firm_route(
+    start_lat: Optional[float] = None,
+    start_lon: Optional[float] = None,
+    excluded_ids: Optional[AbstractSet[str]] = None,
+) -> List[Dict]:
+    # Історична точка → магазин → гастро;
+    # повертає стільки зупинок, скільки вдалося знайти
     if not GOOGLE_API_KEY:
-        return None
-
-    excluded_ids = excluded_ids or set()
-    types_pool = allowed_types or ALLOWED_TYPES
-    used_types = set()
-    attempts = 0
+        return []
 
-    while attempts < 40:
-        attempts += 1
-        choices = list(set(types_pool) - used_types) or types_pool
-        t = random.choice(choices)
-        used_types.add(t)
-
-        resp = requests.get(
-            "https://maps.googleapis.com/maps/api/place/nearbysearch/json",
-            params={
-                "location": f"{lat},{lon}",
-                "radius": radius,
-                "type": t,
-                "key": GOOGLE_API_KEY,
-            },
-            timeout=10,
-        ).json()
+    excluded = set(excluded_ids or ())
+    lat = start_lat if start_lat is not None else CENTER_LAT
+    lon = start_lon if start_lon is not None else CENTER_LON
+    await refresh_feedback_index()
 
-        candidates = resp.get("results", [])
-        random.shuffle(candidates)
+    firsts = await _collect_candidates(
+        lat, lon, INITIAL_RADIUS, HISTORICAL_TYPES, excluded, "history"
+    )
+    if not firsts:
+        firsts = await _collect_candidates(
+            lat, lon, MAX_RADIUS, HISTORICAL_TYPES, excluded, "history"
+        )
+    if not firsts:
+        return []
 
-        for item in candidates:
-            pid = item.get("place_id")
-            if not pid or pid in excluded_ids:
-                continue
-            if item.get("user_ratings_total", 0) <= 0:
-                continue
-            if not is_place_allowed(item, section=section):
+    # Кілька ланцюжків паралельно; перший повний виграє, решта скасовується
+    tasks = [
+        asyncio.ensure_future(_firm_chain(first, excluded))
+        for first in firsts[:FIRM_CANDIDATES]
+    ]
+    best: List[Dict] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                route = await next_done
+            except Exception as e:
+                print("Firm route chain error:", e)
                 continue
-            return _place_from_item(item)
-    return None
+            if len(route) == 3:
+                return route
+            if len(route) > len(best):
+                best = route
+    finally:
+        for task in tasks:
+            task.cancel()
+    return best
+
+
+async def _harvest_main() -> None:
+    try:
+        harvested = await harvest_catalog()
+        print(f"Catalog harvested: {harvested} cells, {catalog.stats()}")
+    finally:
+        await close_http_session()
+        catalog.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_harvest_main())
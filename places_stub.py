@@ -0,0 +1,160 @@
+"""Локальна заглушка Google Places для розробки без ключа й квоти.
+
+    python places_stub.py
+    PLACES_LEGACY_URL=http://127.0.0.1:8765/maps/api/place \\
+    PLACES_NEW_URL=http://127.0.0.1:8765/v1 GOOGLE_API_KEY=stub python main.py
+
+Відповідає як legacy nearbysearch (з next_page_token і затримкою його активації),
+так і Places API (New) places:searchNearby з урахуванням X-Goog-FieldMask.
+"""
+import math
+import os
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+HOST = os.getenv("STUB_HOST", "127.0.0.1")
+PORT = int(os.getenv("STUB_PORT", "8765"))
+TOKEN_DELAY = float(os.getenv("STUB_TOKEN_DELAY", "2"))
+PAGE_SIZE = 20
+PAGES = 3
+PHOTO_FILE = "odesa_logo.jpg"
+
+NAMES = [
+    "Дерибасівська", "Приморський", "Пасаж", "Ланжерон", "Аркадія", "Молдаванка",
+    "Market", "Beer Hall", "Villa", "Hostel", "Museum", "Кав'ярня", "Садиба", "Gallery",
+]
+
+_tokens = {}
+
+
+def _places(
+    lat: float, lon: float, radius: float, place_type: str, count: int, seed: str
+):
+    # Детерміновано для однакового запиту, щоб кеш і повтори бачили ті самі місця
+    rnd = random.Random(
+        f"{seed}:{place_type}:{round(lat, 3)}:{round(lon, 3)}:{int(radius)}"
+    )
+    places = []
+    for i in range(count):
+        r = radius * math.sqrt(rnd.random())
+        angle = rnd.random() * 2 * math.pi
+        places.append({
+            "id": f"stub_{place_type}_{rnd.randrange(10 ** 8)}_{i}",
+            "name": f"{rnd.choice(NAMES)} {place_type.replace('_', ' ')} {i + 1}",
+            "lat": lat + r * math.cos(angle) / 111320,
+            "lon": lon + r * math.sin(angle) / (111320 * math.cos(math.radians(lat))),
+            "rating": rnd.choice([None, 3.6, 4.1, 4.4, 4.8]),
+            "reviews": rnd.choice([0, 3, 12, 40, 250, 1800]),
+            "types": [place_type, "point_of_interest", "establishment"],
+        })
+    return places
+
+
+def _legacy_item(place):
+    item = {
+        "place_id": place["id"],
+        "name": place["name"],
+        "geometry": {"location": {"lat": place["lat"], "lng": place["lon"]}},
+        "user_ratings_total": place["reviews"],
+        "vicinity": "Одеса",
+        "types": place["types"],
+        "photos": [{"photo_reference": f"ref_{place['id']}"}],
+    }
+    if place["rating"] is not None:
+        item["rating"] = place["rating"]
+    return item
+
+
+def _new_item(place, fields):
+    item = {
+        "id": place["id"],
+        "displayName": {"text": place["name"], "languageCode": "uk"},
+        "location": {"latitude": place["lat"], "longitude": place["lon"]},
+        "rating": place["rating"],
+        "userRatingCount": place["reviews"],
+        "shortFormattedAddress": "Одеса",
+        "photos": [{"name": f"places/{place['id']}/photos/ref_{place['id']}"}],
+        "types": place["types"],
+    }
+    return {k: v for k, v in item.items() if k in fields and v is not None}
+
+
+async def nearbysearch(request: web.Request) -> web.Response:
+    query = request.query
+    if not query.get("key"):
+        return web.json_response({"status": "REQUEST_DENIED", "results": []})
+
+    token = query.get("pagetoken")
+    if token:
+        page = _tokens.get(token)
+        if page is None or time.monotonic() < page["ready_at"]:
+            return web.json_response({"status": "INVALID_REQUEST", "results": []})
+        results, index = page["results"], page["index"]
+    else:
+        lat, lon = map(float, query["location"].split(","))
+        place_type = query.get("type", "point_of_interest")
+        total = random.Random(place_type).randint(0, PAGE_SIZE * PAGES)
+        radius = float(query.get("radius", 1000))
+        places = _places(lat, lon, radius, place_type, total, "legacy")
+        results = [_legacy_item(p) for p in places]
+        index = 0
+
+    chunk = results[index:index + PAGE_SIZE]
+    body = {"status": "OK" if chunk else "ZERO_RESULTS", "results": chunk}
+    if index + PAGE_SIZE < len(results):
+        next_token = uuid.uuid4().hex
+        _tokens[next_token] = {
+            "results": results,
+            "index": index + PAGE_SIZE,
+            "ready_at": time.monotonic() + TOKEN_DELAY,
+        }
+        body["next_page_token"] = next_token
+    return web.json_response(body)
+
+
+def _error(code: int, message: str) -> web.Response:
+    return web.json_response({"error": {"code": code, "message": message}}, status=code)
+
+
+async def search_nearby(request: web.Request) -> web.Response:
+    if not request.headers.get("X-Goog-Api-Key"):
+        return _error(403, "API key missing")
+    mask = request.headers.get("X-Goog-FieldMask")
+    if not mask:
+        return _error(400, "FieldMask is required")
+    fields = {f.split(".", 1)[1] for f in mask.split(",") if f.startswith("places.")}
+
+    body = await request.json()
+    types = body.get("includedTypes") or ["point_of_interest"]
+    if len(types) > 50:
+        return _error(400, "Too many includedTypes")
+    circle = body["locationRestriction"]["circle"]
+    lat, lon = circle["center"]["latitude"], circle["center"]["longitude"]
+    places = []
+    for place_type in types:
+        places.extend(_places(lat, lon, circle["radius"], place_type, 4, "new"))
+    random.Random(",".join(types)).shuffle(places)
+    places = places[:int(body.get("maxResultCount", 20))]
+    if not places:
+        return web.json_response({})
+    return web.json_response({"places": [_new_item(p, fields) for p in places]})
+
+
+async def photo(_request: web.Request) -> web.Response:
+    return web.FileResponse(PHOTO_FILE)
+
+
+def build_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/maps/api/place/nearbysearch/json", nearbysearch)
+    app.router.add_get("/maps/api/place/photo", photo)
+    app.router.add_post("/v1/places:searchNearby", search_nearby)
+    app.router.add_get("/v1/places/{place_id}/photos/{ref}/media", photo)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(build_app(), host=HOST, port=PORT)
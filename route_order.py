@@ -0,0 +1,178 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+EXACT_MAX_STOPS = 10
+
+
+def distance_matrix(points: Sequence[Tuple[float, float]]) -> np.ndarray:
+    # Попарний haversine одним проходом numpy замість n² викликів geo.distance_m
+    coords = np.radians(np.asarray(points, dtype=float))
+    lat, lon = coords[:, 0], coords[:, 1]
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    cos_lat = np.cos(lat)
+    a = np.sin(dlat / 2) ** 2 + np.outer(cos_lat, cos_lat) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distances_from(
+    lat: float, lon: float, points: Sequence[Tuple[float, float]]
+) -> np.ndarray:
+    coords = np.radians(np.asarray(points, dtype=float))
+    lat0, lon0 = np.radians(lat), np.radians(lon)
+    dlat = coords[:, 0] - lat0
+    dlon = coords[:, 1] - lon0
+    cos_lat = np.cos(lat0) * np.cos(coords[:, 0])
+    a = np.sin(dlat / 2) ** 2 + cos_lat * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def path_length(order: Sequence[int], dist: np.ndarray) -> float:
+    if len(order) < 2:
+        return 0.0
+    order = np.asarray(order)
+    return float(dist[order[:-1], order[1:]].sum())
+
+
+def _held_karp(dist: np.ndarray) -> List[int]:
+    # Точний відкритий шлях з вузла 0 через усі інші, кінець довільний
+    k = len(dist) - 1
+    stops = dist[1:, 1:]
+    full = 1 << k
+    cost = np.full((full, k), np.inf)
+    parent = np.full((full, k), -1, dtype=np.int64)
+    for j in range(k):
+        cost[1 << j, j] = dist[0, j + 1]
+    bits = 1 << np.arange(k)
+    for mask in range(1, full):
+        row = cost[mask]
+        if not np.isfinite(row).any():
+            continue
+        # Перехід з кожного останнього j у кожен ще не відвіданий next
+        step = row[:, None] + stops
+        best_prev = step.argmin(axis=0)
+        best = step[best_prev, np.arange(k)]
+        nxt = np.nonzero((mask & bits) == 0)[0]
+        target = mask | bits[nxt]
+        better = best[nxt] < cost[target, nxt]
+        nxt, target = nxt[better], target[better]
+        cost[target, nxt] = best[nxt]
+        parent[target, nxt] = best_prev[nxt]
+    mask = full - 1
+    last = int(cost[mask].argmin())
+    order = []
+    while last != -1:
+        order.append(last + 1)
+        mask, last = mask ^ (1 << last), int(parent[mask, last])
+    return [0] + order[::-1]
+
+
+def _nearest_neighbour(dist: np.ndarray) -> List[int]:
+    order = [0]
+    left = set(range(1, len(dist)))
+    while left:
+        current = order[-1]
+        nxt = min(left, key=lambda j: dist[current, j])
+        order.append(nxt)
+        left.remove(nxt)
+    return order
+
+
+def _two_opt(order: List[int], dist: np.ndarray) -> List[int]:
+    # Відкритий шлях: перший вузол (старт) фіксований, хвіст можна розвертати цілком
+    order = list(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(order) - 1):
+            for j in range(i + 1, len(order)):
+                a, b = order[i - 1], order[i]
+                c = order[j]
+                d = order[j + 1] if j + 1 < len(order) else None
+                before = dist[a, b] + (dist[c, d] if d is not None else 0)
+                after = dist[a, c] + (dist[b, d] if d is not None else 0)
+                if after < before - 1e-6:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+    return order
+
+
+def solve_order(dist: np.ndarray) -> List[int]:
+    if len(dist) <= 2:
+        return list(range(len(dist)))
+    if len(dist) - 1 <= EXACT_MAX_STOPS:
+        return _held_karp(dist)
+    return _two_opt(_nearest_neighbour(dist), dist)
+
+
+def order_route(
+    places: List[Dict],
+    start_lat: Optional[float] = None,
+    start_lon: Optional[float] = None,
+) -> Tuple[List[Dict], float]:
+    """Впорядковує зупинки в найкоротший пішохідний шлях; повертає (зупинки, метри)."""
+    if not places:
+        return places, 0.0
+    points = [(p["lat"], p["lon"]) for p in places]
+    has_start = start_lat is not None and start_lon is not None
+    if has_start:
+        dist = distance_matrix([(start_lat, start_lon)] + points)
+    else:
+        # Без точки старту — фіктивний вузол на нульовій відстані від усіх,
+        # шлях може почати з будь-якої зупинки
+        dist = np.zeros((len(points) + 1, len(points) + 1))
+        dist[1:, 1:] = distance_matrix(points)
+    order = solve_order(dist)
+    total = path_length(order if has_start else order[1:], dist)
+    return [places[i - 1] for i in order[1:]], total
+
+
+def route_length(
+    places: List[Dict],
+    start_lat: Optional[float] = None,
+    start_lon: Optional[float] = None,
+) -> float:
+    """Довжина шляху в заданому порядку зупинок (для маршрутів з фіксованою чергою)."""
+    points = [(p["lat"], p["lon"]) for p in places]
+    if start_lat is not None and start_lon is not None:
+        points.insert(0, (start_lat, start_lon))
+    if len(points) < 2:
+        return 0.0
+    return path_length(range(len(points)), distance_matrix(points))
+
+
+def _benchmark():
+    import random
+    import timeit
+
+    from geo import distance_m
+
+    for n in (6, 11, 50):
+        points = [
+            (46.47 + random.random() * 0.03, 30.71 + random.random() * 0.04)
+            for _ in range(n)
+        ]
+
+        def scalar_matrix(p=points):
+            return [[distance_m(*a, *b) for b in p] for a in p]
+
+        scalar = timeit.timeit(scalar_matrix, number=200) / 200
+        vector = timeit.timeit(lambda p=points: distance_matrix(p), number=200) / 200
+        dist = distance_matrix(points)
+        check = max(
+            abs(dist[i, j] - distance_m(*points[i], *points[j]))
+            for i in range(n)
+            for j in range(n)
+        )
+        solve = timeit.timeit(lambda d=dist: solve_order(d), number=5) / 5
+        print(
+            f"n={n:>3}: scalar {scalar * 1e3:.3f} ms, numpy {vector * 1e3:.3f} ms "
+            f"(x{scalar / vector:.1f}, max diff {check:.2e} m), "
+            f"order {solve * 1e3:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,78 @@
+import asyncio
+import contextlib
+import os
+import time
+from collections import deque
+from typing import AbstractSet, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+POOL_SIZE = int(os.getenv("ROUTE_POOL_SIZE", "3"))
+REFILL_INTERVAL = 60
+MAX_ROUTE_AGE = 3600
+
+RouteBuilder = Callable[[], Awaitable[List[Dict]]]
+
+
+class RoutePool:
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size
+        self._builders: Dict[str, Tuple[int, RouteBuilder]] = {}
+        self._routes: Dict[str, Deque[Tuple[float, List[Dict]]]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add_section(self, name: str, length: int, builder: RouteBuilder) -> None:
+        self._builders[name] = (length, builder)
+        self._routes[name] = deque()
+
+    # Перший маршрут без уже відвіданих користувачем місць; пул дозаповнюється у фоні
+    def pop(
+        self, name: str, visited: AbstractSet[str], length: Optional[int] = None
+    ) -> Optional[List[Dict]]:
+        routes = self._routes.get(name)
+        if not routes or (length is not None and self._builders[name][0] != length):
+            return None
+        now = time.time()
+        picked = None
+        for entry in list(routes):
+            created_at, route = entry
+            if now - created_at > MAX_ROUTE_AGE:
+                routes.remove(entry)
+                continue
+            if not any(p.get("place_id") in visited for p in route):
+                routes.remove(entry)
+                picked = route
+                break
+        self._wakeup.set()
+        return picked
+
+    async def _refill(self, name: str) -> None:
+        length, builder = self._builders[name]
+        routes = self._routes[name]
+        while len(routes) < self.size:
+            route = await builder()
+            if len(route) < length:
+                break
+            routes.append((time.time(), route))
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            for name in self._builders:
+                try:
+                    await self._refill(name)
+                except Exception as e:
+                    print(f"Route pool refill error [{name}]:", e)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), REFILL_INTERVAL)
+
+    def start(self) -> None:
+        if self.size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {name: len(routes) for name, routes in self._routes.items()}
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import storage
+
+# memory — лише для одного процесу; sqlite — спільна база для кількох процесів бота
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(24 * 3600)))
+PURGE_EVERY = 1000
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, ttl: int = SESSION_TTL):
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+        self._writes = 0
+
+    async def _write(self, key: str, value: Optional[str]) -> None:
+        if value is None:
+            await asyncio.to_thread(storage.delete_session, key)
+        else:
+            expires_at = time.time() + self.ttl
+            await asyncio.to_thread(storage.set_session, key, value, expires_at)
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            await asyncio.to_thread(storage.purge_sessions, time.time())
+
+    async def _read(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(storage.get_session, key, time.time())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._write(self.key_builder.build(key, "state"), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._read(self.key_builder.build(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        value = json.dumps(dict(data), ensure_ascii=False) if data else None
+        await self._write(self.key_builder.build(key, "data"), value)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self._read(self.key_builder.build(key, "data"))
+        return json.loads(value) if value else {}
+
+    async def close(self) -> None:
+        pass
+
+
+def build_session_storage() -> BaseStorage:
+    if SESSION_BACKEND == "memory":
+        return MemoryStorage()
+    return SQLiteStorage()
+
+
+async def pop_session(state: FSMContext, name: str) -> Optional[dict]:
+    data = await state.get_data()
+    value = data.pop(name, None)
+    if value is not None:
+        await state.set_data(data)
+    return value
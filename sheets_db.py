@@ -1,56 +1,153 @@
-import os
+import asyncio
 import json
+import os
+import random
 from datetime import datetime
 
 import gspread
+from dotenv import load_dotenv
 from google.oauth2.service_account import Credentials
 
+load_dotenv()
 SPREADSHEET_NAME = os.getenv("GOOGLE_SHEETS_SPREADSHEET")
 CREDS_JSON = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
 
-client = None
-
-try:
-    creds_dict = json.loads(CREDS_JSON)
-    creds = Credentials.from_service_account_info(creds_dict, scopes=[
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive"
-    ])
-    client = gspread.authorize(creds)
-    print("Google Sheets connected")
-except Exception as e:
-    print("Google Sheets ERROR:", e)
-
+BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", "50"))
+FLUSH_INTERVAL = float(os.getenv("SHEETS_FLUSH_INTERVAL", "5"))
+QUEUE_SIZE = 10000
+MAX_RETRIES = 5
 
-def save_user(user_id, username, first_name):
-    if not client:
-        return
+client = None
 
+if CREDS_JSON and SPREADSHEET_NAME:
     try:
-        sheet = client.open(SPREADSHEET_NAME).worksheet("users")
-        sheet.append_row([
-            user_id,
-            username or "",
-            first_name or "",
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        creds_dict = json.loads(CREDS_JSON)
+        creds = Credentials.from_service_account_info(creds_dict, scopes=[
+            "https://www.googleapis.com/auth/spreadsheets",
+            "https://www.googleapis.com/auth/drive"
         ])
+        client = gspread.authorize(creds)
+        print("Google Sheets connected")
     except Exception as e:
-        print("save_user error:", e)
+        print("Google Sheets ERROR:", e)
+else:
+    print(
+        "Google Sheets disabled: "
+        "missing GOOGLE_SERVICE_ACCOUNT_JSON or GOOGLE_SHEETS_SPREADSHEET"
+    )
 
 
-def save_feedback(user_id, section, place_id, name, feedback):
-    if not client:
-        return
+class SheetsSink:
+    def __init__(self, gs_client, spreadsheet_name):
+        self.client = gs_client
+        self.spreadsheet_name = spreadsheet_name
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._spreadsheet = None
+        self._worksheets = {}
+        self._task = None
 
-    try:
-        sheet = client.open(SPREADSHEET_NAME).worksheet("place_feedback")
-        sheet.append_row([
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            user_id,
-            section,
-            place_id,
-            name,
-            feedback
-        ])
-    except Exception as e:
-        print("save_feedback error:", e)
+    @property
+    def enabled(self) -> bool:
+        return bool(self.client and self.spreadsheet_name)
+
+    def append_row(self, worksheet_name: str, row: list):
+        if not self.enabled:
+            return
+        try:
+            self._queue.put_nowait((worksheet_name, row))
+        except asyncio.QueueFull:
+            print(f"GS queue full, row dropped [{worksheet_name}]")
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        by_sheet = {}
+        for worksheet_name, row in batch:
+            by_sheet.setdefault(worksheet_name, []).append(row)
+        for worksheet_name, rows in by_sheet.items():
+            for attempt in range(MAX_RETRIES):
+                try:
+                    await asyncio.to_thread(self._append_rows, worksheet_name, rows)
+                    break
+                except Exception as e:
+                    # Кеш хендлів міг застаріти — наступна спроба відкриє їх заново
+                    self._worksheets.pop(worksheet_name, None)
+                    if attempt == MAX_RETRIES - 1:
+                        print(
+                            f"GS append error [{worksheet_name}], "
+                            f"{len(rows)} rows dropped:",
+                            e,
+                        )
+                        break
+                    await asyncio.sleep(2 ** attempt + random.random())
+
+    def _worksheet(self, worksheet_name: str):
+        sheet = self._worksheets.get(worksheet_name)
+        if sheet is None:
+            if self._spreadsheet is None:
+                self._spreadsheet = self.client.open(self.spreadsheet_name)
+            sheet = self._spreadsheet.worksheet(worksheet_name)
+            self._worksheets[worksheet_name] = sheet
+        return sheet
+
+    def _append_rows(self, worksheet_name: str, rows: list):
+        self._worksheet(worksheet_name).append_rows(rows)
+
+
+sink = SheetsSink(client, SPREADSHEET_NAME)
+
+
+def append_row(worksheet_name: str, row: list):
+    sink.append_row(worksheet_name, row)
+
+
+def save_user(user_id, username, first_name):
+    append_row("users", [
+        user_id,
+        username or "",
+        first_name or "",
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    ])
+
+
+def save_feedback(user_id, section, place_id, name, feedback):
+    append_row("place_feedback", [
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        user_id,
+        section,
+        place_id,
+        name,
+        feedback
+    ])
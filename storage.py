@@ -0,0 +1,445 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+DB_FILE = os.getenv("BOT_DB_FILE", "bot.db")
+VISITED_LIMIT = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS visited_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    place_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS visited_log_user ON visited_log (user_id, seq);
+CREATE TABLE IF NOT EXISTS limits (
+    day TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, key)
+);
+CREATE TABLE IF NOT EXISTS saved_places (
+    user_id INTEGER NOT NULL,
+    place_id TEXT NOT NULL,
+    saved_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, place_id)
+);
+CREATE TABLE IF NOT EXISTS place_feedback (
+    place_id TEXT PRIMARY KEY,
+    place_name TEXT NOT NULL DEFAULT '',
+    section TEXT NOT NULL DEFAULT '',
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS place_votes (
+    place_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    vote TEXT NOT NULL,
+    PRIMARY KEY (place_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS photo_file_ids (
+    place_id TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    saved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS type_yield (
+    section TEXT NOT NULL,
+    place_type TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    calls INTEGER NOT NULL,
+    accepted INTEGER NOT NULL,
+    PRIMARY KEY (section, place_type, band)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+# Окреме з'єднання на потік: виклики йдуть через asyncio.to_thread
+def _db() -> sqlite3.Connection:
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(SCHEMA)
+                _schema_ready = True
+    return conn
+
+
+class _transaction:
+    def __init__(self):
+        self.conn = _db()
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def feedback_version() -> int:
+    row = _db().execute(
+        "SELECT value FROM meta WHERE key = 'feedback_version'"
+    ).fetchone()
+    return int(row[0]) if row else 0
+
+
+# --- Користувачі ---
+
+def load_user_ids() -> Set[int]:
+    return {row[0] for row in _db().execute("SELECT user_id FROM users")}
+
+
+def add_user(user_id: int) -> bool:
+    cur = _db().execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+    return cur.rowcount > 0
+
+
+# --- Відвідані місця: журнал лише на дописування ---
+
+# Від найстаріших до найновіших, останні limit різних місць
+def load_visited(user_id: int, limit: int = VISITED_LIMIT) -> List[str]:
+    rows = _db().execute(
+        "SELECT place_id FROM visited_log WHERE user_id = ? GROUP BY place_id "
+        "ORDER BY MAX(seq) DESC LIMIT ?",
+        (user_id, limit),
+    ).fetchall()
+    return [row[0] for row in reversed(rows)]
+
+
+def append_visited(user_id: int, place_ids: List[str]) -> None:
+    with _transaction() as conn:
+        conn.executemany(
+            "INSERT INTO visited_log (user_id, place_id) VALUES (?, ?)",
+            [(user_id, pid) for pid in place_ids if pid],
+        )
+
+
+# Прибирає повтори й усе, що випало з вікна кожного користувача
+def compact_visited(limit: int = VISITED_LIMIT) -> int:
+    with _transaction() as conn:
+        dupes = conn.execute(
+            "DELETE FROM visited_log WHERE seq NOT IN "
+            "(SELECT MAX(seq) FROM visited_log GROUP BY user_id, place_id)"
+        ).rowcount
+        stale = conn.execute(
+            "DELETE FROM visited_log WHERE seq IN (SELECT seq FROM ("
+            "SELECT seq, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY seq DESC) "
+            "AS pos FROM visited_log"
+            ") WHERE pos > ?)",
+            (limit,),
+        ).rowcount
+        return dupes + stale
+
+
+# --- Денні ліміти ---
+
+def load_limits(day: str) -> Dict[Tuple[int, str], int]:
+    rows = _db().execute("SELECT user_id, key, count FROM limits WHERE day = ?", (day,))
+    return {(user_id, key): count for user_id, key, count in rows}
+
+
+def save_limits(day: str, rows: List[Tuple[int, str, int]]) -> None:
+    with _transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO limits (day, user_id, key, count) "
+            "VALUES (?, ?, ?, ?)",
+            [(day, user_id, key, count) for user_id, key, count in rows],
+        )
+
+
+# Атомарно в базі — для кількох процесів бота,
+# кожен з яких інакше рахував би свої ліміти
+def acquire_limit(day: str, user_id: int, key: str, limit: int) -> bool:
+    cur = _db().execute(
+        "INSERT INTO limits (day, user_id, key, count) SELECT ?, ?, ?, 1 WHERE ? > 0 "
+        "ON CONFLICT (day, user_id, key) "
+        "DO UPDATE SET count = count + 1 WHERE count < ?",
+        (day, user_id, key, limit, limit),
+    )
+    return cur.rowcount == 1
+
+
+def release_limit(day: str, user_id: int, key: str) -> None:
+    _db().execute(
+        "UPDATE limits SET count = count - 1 "
+        "WHERE day = ? AND user_id = ? AND key = ? AND count > 0",
+        (day, user_id, key),
+    )
+
+
+def prune_limits(today: str) -> None:
+    _db().execute("DELETE FROM limits WHERE day < ?", (today,))
+
+
+# --- Збережені місця ---
+
+def load_saved(user_id: int) -> List[str]:
+    rows = _db().execute(
+        "SELECT place_id FROM saved_places WHERE user_id = ? ORDER BY rowid", (user_id,)
+    )
+    return [row[0] for row in rows]
+
+
+def save_place(user_id: int, place_id: str) -> bool:
+    cur = _db().execute(
+        "INSERT OR IGNORE INTO saved_places (user_id, place_id) VALUES (?, ?)",
+        (user_id, place_id),
+    )
+    return cur.rowcount > 0
+
+
+# --- Відгуки про місця ---
+
+def _votes(conn: sqlite3.Connection, place_id: str) -> Dict[str, int]:
+    rows = conn.execute(
+        "SELECT vote, COUNT(*) FROM place_votes WHERE place_id = ? GROUP BY vote",
+        (place_id,),
+    )
+    return dict(rows)
+
+
+def add_place_feedback(
+    place_id: str,
+    section: str,
+    value: str,
+    user_id: int,
+    place_name: str,
+    updated_at: str,
+) -> Dict:
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT INTO place_feedback (place_id, place_name, section, updated_at) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (place_id) DO UPDATE SET "
+            "place_name = CASE WHEN excluded.place_name != '' "
+            "THEN excluded.place_name ELSE place_name END, "
+            "section = excluded.section, updated_at = excluded.updated_at",
+            (place_id, place_name, section, updated_at),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO place_votes (place_id, user_id, vote) "
+            "VALUES (?, ?, ?)",
+            (place_id, str(user_id), value),
+        )
+        # Лічильник змін відгуків: інші процеси перечитують індекс рішень,
+        # лише коли він зріс
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('feedback_version', '1') "
+            "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+        (version,) = conn.execute(
+            "SELECT value FROM meta WHERE key = 'feedback_version'"
+        ).fetchone()
+        (stored_name,) = conn.execute(
+            "SELECT place_name FROM place_feedback WHERE place_id = ?", (place_id,)
+        ).fetchone()
+        return {
+            "place_name": stored_name,
+            "votes": _votes(conn, place_id),
+            "version": int(version),
+        }
+
+
+def load_place_votes() -> Dict[str, Dict[str, int]]:
+    votes: Dict[str, Dict[str, int]] = {}
+    rows = _db().execute(
+        "SELECT place_id, vote, COUNT(*) FROM place_votes GROUP BY place_id, vote"
+    )
+    for place_id, vote, count in rows:
+        votes.setdefault(place_id, {})[vote] = count
+    return votes
+
+
+# --- Стан діалогів (FSM) ---
+
+def get_session(key: str, now: float) -> Optional[str]:
+    row = _db().execute(
+        "SELECT value FROM sessions WHERE key = ? AND expires_at > ?", (key, now)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def set_session(key: str, value: str, expires_at: float) -> None:
+    _db().execute(
+        "INSERT OR REPLACE INTO sessions (key, value, expires_at) VALUES (?, ?, ?)",
+        (key, value, expires_at),
+    )
+
+
+def delete_session(key: str) -> None:
+    _db().execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+
+def purge_sessions(now: float) -> None:
+    _db().execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+
+# --- file_id фото в Telegram ---
+
+def load_photo_ids(limit: int) -> List[Tuple[str, str]]:
+    rows = _db().execute(
+        "SELECT place_id, file_id FROM photo_file_ids ORDER BY saved_at DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+    return list(reversed(rows))
+
+
+def save_photo_id(
+    place_id: str, file_id: str, saved_at: float, evicted: List[str]
+) -> None:
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO photo_file_ids (place_id, file_id, saved_at) "
+            "VALUES (?, ?, ?)",
+            (place_id, file_id, saved_at),
+        )
+        conn.executemany(
+            "DELETE FROM photo_file_ids WHERE place_id = ?",
+            [(pid,) for pid in evicted],
+        )
+
+
+def touch_photo_ids(place_ids: List[str], used_at: float) -> None:
+    with _transaction() as conn:
+        conn.executemany(
+            "UPDATE photo_file_ids SET saved_at = ? WHERE place_id = ?",
+            [(used_at, pid) for pid in place_ids],
+        )
+
+
+def delete_photo_id(place_id: str) -> None:
+    _db().execute("DELETE FROM photo_file_ids WHERE place_id = ?", (place_id,))
+
+
+# --- Результативність типів nearbysearch ---
+
+def load_type_yield() -> Dict[Tuple[str, str, int], Tuple[int, int]]:
+    rows = _db().execute(
+        "SELECT section, place_type, band, calls, accepted FROM type_yield"
+    )
+    return {
+        (section, place_type, band): (calls, accepted)
+        for section, place_type, band, calls, accepted in rows
+    }
+
+
+def save_type_yield(rows: List[Tuple[str, str, int, int, int]]) -> None:
+    # rows — прирости з останнього скидання, а не підсумки
+    with _transaction() as conn:
+        conn.executemany(
+            "INSERT INTO type_yield (section, place_type, band, calls, accepted) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (section, place_type, band) DO UPDATE SET "
+            "calls = calls + excluded.calls, accepted = accepted + excluded.accepted",
+            rows,
+        )
+
+
+# --- Одноразова міграція зі старих JSON-файлів ---
+
+def _read_json(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return default
+
+
+def migrate_from_json(
+    users_file: str,
+    visited_file: str,
+    limits_file: str,
+    saved_file: str,
+    feedback_file: str,
+) -> bool:
+    with _transaction() as conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return False
+
+        users = _read_json(users_file, [])
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
+            [(int(u),) for u in users],
+        )
+
+        for user_id, place_ids in _read_json(visited_file, {}).items():
+            conn.executemany(
+                "INSERT INTO visited_log (user_id, place_id) VALUES (?, ?)",
+                [(int(user_id), pid) for pid in place_ids if pid],
+            )
+
+        for day, per_user in _read_json(limits_file, {}).items():
+            for user_id, counters in per_user.items():
+                conn.executemany(
+                    "INSERT OR REPLACE INTO limits (day, user_id, key, count) "
+                    "VALUES (?, ?, ?, ?)",
+                    [
+                        (day, int(user_id), key, count)
+                        for key, count in counters.items()
+                    ],
+                )
+
+        for user_id, place_ids in _read_json(saved_file, {}).items():
+            conn.executemany(
+                "INSERT OR IGNORE INTO saved_places (user_id, place_id) VALUES (?, ?)",
+                [(int(user_id), pid) for pid in place_ids if pid],
+            )
+
+        for place_id, rec in _read_json(feedback_file, {}).items():
+            conn.execute(
+                "INSERT OR REPLACE INTO place_feedback "
+                "(place_id, place_name, section, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    place_id,
+                    rec.get("place_name", ""),
+                    rec.get("section", ""),
+                    rec.get("updated_at", ""),
+                ),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO place_votes (place_id, user_id, vote) "
+                "VALUES (?, ?, ?)",
+                [
+                    (place_id, user_id, vote)
+                    for user_id, vote in rec.get("user_votes", {}).items()
+                ],
+            )
+
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', '1')")
+        return True
+
+
+if __name__ == "__main__":
+    migrated = migrate_from_json(
+        "users.json",
+        "visited.json",
+        "limits.json",
+        "saved_places.json",
+        "place_feedback.json",
+    )
+    print("JSON migrated" if migrated else "Already migrated")
@@ -0,0 +1,73 @@
+import random
+from typing import Dict, Optional
+
+import pytest
+
+from place_filters import BAD_GASTRO_WORDS, BAD_HOTEL_WORDS, filter_batch, is_allowed
+
+SECTIONS = ["gastro", "hotels", "history", "shop", None]
+
+
+def legacy_is_place_allowed(
+    item: Dict, section: Optional[str], decision: Optional[str]
+) -> bool:
+    # Початкова реалізація is_place_allowed — еталон для скомпільованих правил
+    name = item.get("name", "")
+    low = (name or "").lower()
+    if decision in {"wrong", "closed"}:
+        return False
+    if section == "gastro":
+        if decision in {"shop", "wrong", "closed"}:
+            return False
+        if any(word in low for word in BAD_GASTRO_WORDS):
+            return False
+        if item.get("rating", 0) and item.get("rating", 0) < 4.0:
+            return False
+        if item.get("user_ratings_total", 0) < 15:
+            return False
+    if section == "hotels":
+        if decision in {"cottage", "wrong", "closed"}:
+            return False
+        if any(word in low for word in BAD_HOTEL_WORDS):
+            return False
+        if item.get("user_ratings_total", 0) < 5:
+            return False
+    return True
+
+
+def sample_items(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    plain = ["кафе", "hotel", "бар", "музей", "ресторан", "Odesa"]
+    words = BAD_GASTRO_WORDS + BAD_HOTEL_WORDS + plain
+    items = [
+        {
+            "place_id": f"p{i}",
+            "name": (
+                rng.choice([None, ""]) if i % 50 == 0
+                else " ".join(rng.choice(words) for _ in range(3)).title()
+            ),
+            "rating": rng.choice([None, 0, 3.2, 4.0, 4.7]),
+            "user_ratings_total": rng.randint(0, 60),
+        }
+        for i in range(count)
+    ]
+    choices = [None] * 8 + ["wrong", "closed", "shop", "cottage"]
+    decisions = {f"p{i}": rng.choice(choices) for i in range(count)}
+    return items, decisions
+
+
+@pytest.mark.parametrize("section", SECTIONS)
+def test_compiled_rules_match_legacy(section):
+    items, decisions = sample_items(3000)
+    expected = [
+        it for it in items
+        if legacy_is_place_allowed(it, section, decisions[it["place_id"]])
+    ]
+    single = [it for it in items if is_allowed(it, section, decisions[it["place_id"]])]
+
+    assert filter_batch(items, section, decisions.get) == expected
+    assert single == expected
+
+
+def test_empty_batch():
+    assert filter_batch([], "gastro", lambda _: None) == []
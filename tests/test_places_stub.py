@@ -0,0 +1,77 @@
+import asyncio
+import random
+
+from aiohttp import web
+
+import places
+import places_stub
+
+LAT, LON = 46.4825, 30.7233
+
+
+def _paged_type() -> str:
+    # Заглушка віддає для типу randint(0, 60) місць з random.Random(type) —
+    # беремо тип на 3 сторінки
+    return next(t for t in places.CATALOG_TYPES if random.Random(t).randint(0, 60) > 40)
+
+
+async def _with_stub(monkeypatch, check):
+    runner = web.AppRunner(places_stub.build_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    base = f"http://127.0.0.1:{port}"
+
+    monkeypatch.setattr(places_stub, "TOKEN_DELAY", 0.05)
+    monkeypatch.setattr(places, "GOOGLE_API_KEY", "stub")
+    monkeypatch.setattr(places, "CATALOG_ENABLED", False)
+    monkeypatch.setattr(places, "PAGE_TOKEN_DELAY", 0.1)
+    monkeypatch.setattr(places, "LEGACY_API_URL", f"{base}/maps/api/place")
+    monkeypatch.setattr(places, "NEW_API_URL", f"{base}/v1")
+    nearby_url = f"{base}/maps/api/place/nearbysearch/json"
+    monkeypatch.setattr(places, "NEARBY_URL", nearby_url)
+    monkeypatch.setattr(places, "SEARCH_NEARBY_URL", f"{base}/v1/places:searchNearby")
+    monkeypatch.setattr(places, "nearby_cache", places.NearbyCache(3600, 100))
+    try:
+        await check(base)
+    finally:
+        await places.close_http_session()
+        await runner.cleanup()
+
+
+def test_backends_normalize_to_same_place_keys(monkeypatch):
+    async def check(base):
+        legacy = await places._nearby_search(LAT, LON, 700, "museum")
+        new = await places._search_nearby_all(LAT, LON, 700, ["museum", "park"])
+        assert legacy and new
+
+        legacy_place = places._place_from_item(legacy[0])
+        new_place = places._place_from_item(new[0][1])
+        assert set(legacy_place) == set(new_place)
+        assert legacy_place["photo"].startswith(f"{base}/maps/api/place/photo")
+        assert new_place["photo"].startswith(f"{base}/v1/places/")
+        assert {t for t, _ in new} <= {"museum", "park"}
+
+    asyncio.run(_with_stub(monkeypatch, check))
+
+
+def test_next_page_token_is_followed(monkeypatch):
+    async def check(_base):
+        place_type = _paged_type()
+        first = await places._nearby_search(LAT, LON, 700, place_type)
+        assert len(first) == places.PAGE_SIZE
+        calls = places.nearby_cache.api_calls
+
+        full = await places._nearby_search(LAT, LON, 700, place_type, more=True)
+        assert len(full) > places.PAGE_SIZE
+        assert len({item["place_id"] for item in full}) == len(full)
+        assert places.nearby_cache.api_calls > calls
+
+        # Дочитані сторінки лежать у кеші — повторний запит не йде в мережу
+        calls = places.nearby_cache.api_calls
+        again = await places._nearby_search(LAT, LON, 700, place_type, more=True)
+        assert again == full
+        assert places.nearby_cache.api_calls == calls
+
+    asyncio.run(_with_stub(monkeypatch, check))
@@ -0,0 +1,105 @@
+import asyncio
+import random
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import storage
+
+FLUSH_INTERVAL = 30
+BAND_M = 500
+
+# Апріорно вважаємо, що тип дає ~2 придатних місця на запит, з вагою двох запитів
+PRIOR_MEAN = 2.0
+PRIOR_CALLS = 2.0
+# Частка вибору навмання, щоб типи з поганою історією інколи перевірялися знову
+EXPLORE_RATE = 0.1
+
+YieldKey = Tuple[str, str, int]
+
+
+def radius_band(radius: int) -> int:
+    return int(radius) // BAND_M
+
+
+class TypeYield:
+    """Придатні місця на запит nearbysearch для (секція, тип, діапазон радіуса)."""
+
+    def __init__(self):
+        self._stats: Dict[YieldKey, List[int]] = {}
+        # Прирости з останнього скидання: база додає їх до своїх лічильників,
+        # тож процеси не затирають одне одного
+        self._pending: Dict[YieldKey, List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self) -> None:
+        rows = await asyncio.to_thread(storage.load_type_yield)
+        self._stats = {key: list(counts) for key, counts in rows.items()}
+
+    def record(
+        self, section: Optional[str], place_type: str, radius: int, accepted: int
+    ) -> None:
+        key = (section or "random", place_type, radius_band(radius))
+        for counts in (self._stats, self._pending):
+            stat = counts.setdefault(key, [0, 0])
+            stat[0] += 1
+            stat[1] += accepted
+
+    def _draw(self, section: Optional[str], place_type: str, radius: int) -> float:
+        # Thompson sampling по гамма-апостеріорі: мало даних — широкий розкид,
+        # тож нові типи теж виграють
+        key = (section or "random", place_type, radius_band(radius))
+        calls, accepted = self._stats.get(key, (0, 0))
+        return random.gammavariate(
+            PRIOR_MEAN * PRIOR_CALLS + accepted, 1 / (PRIOR_CALLS + calls)
+        )
+
+    def sample(
+        self, section: Optional[str], types: Sequence[str], radius: int, k: int
+    ) -> List[str]:
+        types = list(types)
+        k = min(k, len(types))
+        if random.random() < EXPLORE_RATE:
+            return random.sample(types, k)
+        draws = {t: self._draw(section, t, radius) for t in types}
+        return sorted(types, key=draws.__getitem__, reverse=True)[:k]
+
+    def stats(
+        self, section: Optional[str] = None, top: int = 10
+    ) -> List[Tuple[YieldKey, int, float]]:
+        rows = [
+            (key, calls, accepted / calls)
+            for key, (calls, accepted) in self._stats.items()
+            if calls and (section is None or key[0] == section)
+        ]
+        return sorted(rows, key=lambda r: r[2], reverse=True)[:top]
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [(*key, calls, accepted) for key, (calls, accepted) in pending.items()]
+        try:
+            await asyncio.to_thread(storage.save_type_yield, rows)
+        except Exception:
+            for key, (calls, accepted) in pending.items():
+                stat = self._pending.setdefault(key, [0, 0])
+                stat[0] += calls
+                stat[1] += accepted
+            raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self._flush()
+            except Exception as e:
+                print("Type yield flush error:", e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._flush()
@@ -0,0 +1,28 @@
+import asyncio
+from typing import Optional, Set
+
+import storage
+
+
+class UserRegistry:
+    def __init__(self):
+        self._ids: Optional[Set[int]] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        async with self._lock:
+            if self._ids is None:
+                self._ids = await asyncio.to_thread(storage.load_user_ids)
+
+    # True лише для нового користувача; відомий користувач не чіпає ні базу, ні таблицю
+    async def add(self, user_id: int) -> bool:
+        if self._ids is None:
+            await self.load()
+        if user_id in self._ids:
+            return False
+        self._ids.add(user_id)
+        # Інший процес міг уже записати цього користувача — тоді він не новий
+        return await asyncio.to_thread(storage.add_user, user_id)
+
+    def __len__(self) -> int:
+        return len(self._ids or ())
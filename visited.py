@@ -0,0 +1,83 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Iterable, KeysView, Optional
+
+import storage
+
+WINDOW = storage.VISITED_LIMIT
+MAX_CACHED_USERS = 5000
+COMPACT_INTERVAL = 3600
+# Вікно в пам'яті не бачить записів інших процесів,
+# тож у webhook-режимі кожен запит читає базу
+VISITED_CACHE = os.getenv(
+    "VISITED_CACHE", "0" if os.getenv("BOT_MODE") == "webhook" else "1"
+) == "1"
+
+
+class VisitedStore:
+    def __init__(
+        self,
+        window: int = WINDOW,
+        max_users: int = MAX_CACHED_USERS,
+        cached: bool = VISITED_CACHE,
+    ):
+        self.window = window
+        self.max_users = max_users
+        self.cached = cached
+        self._users: "OrderedDict[int, OrderedDict[str, None]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _load(self, user_id: int) -> "OrderedDict[str, None]":
+        place_ids = await asyncio.to_thread(storage.load_visited, user_id, self.window)
+        return OrderedDict.fromkeys(place_ids)
+
+    async def _window(self, user_id: int) -> "OrderedDict[str, None]":
+        if not self.cached:
+            return await self._load(user_id)
+        window = self._users.get(user_id)
+        if window is None:
+            loaded = await self._load(user_id)
+            # Поки вантажили, інший хендлер міг уже підняти цього користувача
+            window = self._users.setdefault(user_id, loaded)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return window
+
+    # Перевірка "in" за O(1); з кешем це живе представлення,
+    # що бачить подальші add() цього користувача
+    async def get(self, user_id: int) -> KeysView[str]:
+        return (await self._window(user_id)).keys()
+
+    async def add(self, user_id: int, place_ids: Iterable[str]) -> None:
+        place_ids = [pid for pid in place_ids if pid]
+        if not place_ids:
+            return
+        if not self.cached:
+            await asyncio.to_thread(storage.append_visited, user_id, place_ids)
+            return
+        window = await self._window(user_id)
+        for pid in place_ids:
+            window[pid] = None
+            window.move_to_end(pid)
+        while len(window) > self.window:
+            window.popitem(last=False)
+        await asyncio.to_thread(storage.append_visited, user_id, place_ids)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(COMPACT_INTERVAL)
+            try:
+                await asyncio.to_thread(storage.compact_visited, self.window)
+            except Exception as e:
+                print("Visited compaction error:", e)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,57 @@
+import asyncio
+import os
+from typing import Any, Callable, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    # Telegram отримує 200 одразу, а апдейти обробляються у фоні
+    # не більше ніж workers одночасно
+    def __init__(self, *args, workers: int = WEBHOOK_WORKERS, **kwargs):
+        super().__init__(*args, handle_in_background=True, **kwargs)
+        self._slots = asyncio.Semaphore(workers)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._slots:
+            await super()._background_feed_update(bot, update)
+
+
+async def set_webhook(bot: Bot, dp: Dispatcher) -> None:
+    check_config()
+    await bot.set_webhook(
+        f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+
+def check_config() -> None:
+    # Без секрету будь-хто може слати боту підроблені апдейти,
+    # без адреси Telegram не знає, куди слати
+    required = {"WEBHOOK_BASE_URL": WEBHOOK_BASE_URL, "WEBHOOK_SECRET": WEBHOOK_SECRET}
+    missing = [name for name, value in required.items() if not value]
+    if missing:
+        raise RuntimeError(f"BOT_MODE=webhook requires {', '.join(missing)}")
+
+
+def run_webhook(dp: Dispatcher, bot: Bot, health: Callable[[], Dict]) -> None:
+    check_config()
+    async def health_handler(_request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", **health()})
+
+    app = web.Application()
+    handler = BoundedRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET)
+    handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/health", health_handler)
+    setup_application(app, dp, bot=bot)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)